@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+import typing
+
+import numpy as np
+
+import instrumentation
+from indicators import MacdBatch, RsiBatch
+from strategies import TechnicalStrategy, technical_rule
+
+logger = logging.getLogger()
+
+# How long a candle-close burst waits for the rest of its batch before being evaluated without them.
+BATCH_WINDOW = 0.02
+
+# Strategies with the same parameters needed before they are batched. Below about 100, evaluating each on
+# its own is as fast and doesn't wait for the window.
+BATCH_MIN_SIZE = 100
+
+
+def technical_signals(rsi: np.ndarray, macd_line: np.ndarray, macd_signal: np.ndarray) -> np.ndarray:
+    # TechnicalStrategy.check_signal for many strategies at once.
+    long, short = technical_rule(rsi, macd_line, macd_signal)
+    return long.astype(np.int64) - short.astype(np.int64)
+
+
+class _Batch:
+    # MACD/RSI state of every TechnicalStrategy with the same parameters and timeframe, one row per strategy.
+    # When a strategy closes a candle, its close is queued. Once every member has closed that candle, or
+    # BATCH_WINDOW after the first one did, all queued closes go through the indicators and check_signal in
+    # one vectorized pass. Strategies with a buy or sell signal are then sent to check_trade through the
+    # dispatcher. The pass for a complete candle waits for the last member's tick to be queued (flush_due),
+    # so every signal follows the tick it was computed on, which checks take profit and stop loss. The scalar indicators of each strategy only seed its row when it joins or reloads candles.
+    def __init__(self, params: typing.Tuple[int, int, int, int], label: str,
+                 submit: typing.Callable[..., typing.Any], window: float):
+        fast, slow, signal, rsi_length = params
+        self.label = label
+        self._submit = submit
+        self._window = window
+        self._macd = MacdBatch(fast, slow, signal)
+        self._rsi = RsiBatch(rsi_length)
+        self._size = 16
+
+        self.members: typing.List[typing.Optional[TechnicalStrategy]] = []
+        self._free: typing.List[int] = []
+        self.active = 0
+        self._pending: typing.Dict[int, float] = dict()
+        # Row -> (when the trade that closed its pending candle arrived, the strategy's signal_inputs then), for
+        # check_trade, which runs later on a signal worker.
+        self._ticks: typing.Dict[int, typing.Tuple[int, typing.Tuple]] = dict()
+        self._timer: typing.Optional[threading.Timer] = None
+        self._due = False
+        self._lock = threading.Lock()
+
+    def add(self, strategy: TechnicalStrategy):
+        with self._lock:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self.members)
+                self.members.append(None)
+                if row >= self._size:
+                    self._size *= 2
+                    self._macd.resize(self._size)
+                    self._rsi.resize(self._size)
+            self.members[row] = strategy
+            self.active += 1
+            strategy.batch_row = row
+            self._seed(strategy)
+            strategy.batch = self
+
+    def remove(self, strategy: TechnicalStrategy):
+        with self._lock:
+            row = strategy.batch_row
+            strategy.batch = None
+            strategy.batch_row = -1
+            # Its scalar indicators are stale now; rebuild them from the candles if it ever trades again.
+            strategy._candles_generation = -1
+            self.members[row] = None
+            self._free.append(row)
+            self.active -= 1
+            self._pending.pop(row, None)
+            self._ticks.pop(row, None)
+
+    def adopt(self, strategy: TechnicalStrategy):
+        # The strategy recomputed its indicators from reloaded candles, including any close still queued here.
+        with self._lock:
+            self._pending.pop(strategy.batch_row, None)
+            self._ticks.pop(strategy.batch_row, None)
+            self._seed(strategy)
+
+    def _seed(self, strategy: TechnicalStrategy):
+        self._macd.set_row(strategy.batch_row, strategy._macd_state)
+        self._rsi.set_row(strategy.batch_row, strategy._rsi_state)
+
+    def rsi(self, strategy: TechnicalStrategy) -> float:
+        return float(self._rsi.value[strategy.batch_row])
+
+    def macd(self, strategy: TechnicalStrategy) -> typing.Tuple[float, float]:
+        return float(self._macd.macd_line[strategy.batch_row]), float(self._macd.macd_signal[strategy.batch_row])
+
+    def candle_closed(self, strategy: TechnicalStrategy, closes: typing.List[float], received_ns: int = 0):
+        # Called from the websocket thread with every close since the strategy's last one (more after a gap).
+        with self._lock:
+            row = strategy.batch_row
+            if row in self._pending:
+                # Its previous candle hasn't been evaluated yet: do that first, to keep the order.
+                self._flush()
+            if len(closes) > 1:
+                rows = np.array([row])
+                for close in closes[:-1]:
+                    self._update(rows, np.array([close]))
+            self._pending[row] = closes[-1]
+            self._ticks[row] = (received_ns, strategy.signal_inputs('same_candle'))
+
+            if len(self._pending) >= self.active:
+                self._due = True
+            if self._timer is None:
+                self._timer = threading.Timer(self._window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def flush_due(self):
+        # Called by the dispatcher once a member's tick is queued. The timer covers a submit that doesn't.
+        if self._due:
+            self.flush()
+
+    def _update(self, rows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+        macd_line, macd_signal = self._macd.update(rows, closes)
+        return technical_signals(self._rsi.update(rows, closes), macd_line, macd_signal)
+
+    def _flush(self):
+        self._due = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        if instrumentation.enabled:
+            start = time.perf_counter_ns()
+
+        rows = np.fromiter(self._pending.keys(), dtype=np.int64, count=len(self._pending))
+        closes = np.fromiter(self._pending.values(), dtype=np.float64, count=len(self._pending))
+        ticks, self._ticks = self._ticks, dict()
+        self._pending.clear()
+        signals = self._update(rows, closes)
+
+        for row in np.flatnonzero(signals).tolist():
+            strategy = self.members[rows[row]]
+            if strategy is not None:
+                received_ns, inputs = ticks.get(int(rows[row]), (0, None))
+                self._submit(strategy, 'new_candle', int(signals[row]), received_ns, inputs)
+        if instrumentation.enabled:
+            instrumentation.record('batch_signals', self.label, start)
+
+
+class SignalBatcher:
+    # Groups TechnicalStrategies by parameters and timeframe. A group becomes a _Batch once it has min_size
+    # members and stays one from then on. Other strategy types evaluate their own signals.
+    def __init__(self, submit: typing.Callable[..., typing.Any], window: float = BATCH_WINDOW,
+                 min_size: int = BATCH_MIN_SIZE):
+        self._submit = submit
+        self._window = window
+        self._min_size = min_size
+        self._batches: typing.Dict[typing.Tuple, _Batch] = dict()
+        self._waiting: typing.Dict[typing.Tuple, typing.List[TechnicalStrategy]] = dict()
+        self._lock = threading.Lock()
+
+    def add(self, strategy):
+        if not isinstance(strategy, TechnicalStrategy) or strategy.batch is not None:
+            return
+        key = (strategy.timeframe_ms,) + strategy.indicator_params
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                waiting = self._waiting.setdefault(key, [])
+                waiting.append(strategy)
+                if len(waiting) < self._min_size:
+                    return
+                label = f"Technical {strategy.timeframe} {'/'.join(str(p) for p in strategy.indicator_params)}"
+                batch = self._batches[key] = _Batch(strategy.indicator_params, label, self._submit, self._window)
+                del self._waiting[key]
+                for running in waiting[:-1]:
+                    batch.add(running)
+                    # Already trading, so its scalar indicators may move while being copied into the batch.
+                    # It reseeds from its candles on the next trade instead.
+                    running._candles_generation = -1
+        batch.add(strategy)
+
+    def remove(self, strategy):
+        batch = getattr(strategy, 'batch', None)
+        if batch is not None:
+            batch.remove(strategy)
+            return
+        with self._lock:
+            for waiting in self._waiting.values():
+                if strategy in waiting:
+                    waiting.remove(strategy)
+
+    def metrics(self) -> typing.Dict[str, int]:
+        return {batch.label: batch.active for batch in list(self._batches.values())}
@@ -0,0 +1,209 @@
+import typing
+
+import numpy as np
+
+from models import Candle
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def _column_property(name: str):
+    def getter(self):
+        return self._series._data[name][self._series._position(self._index)]
+
+    def setter(self, value):
+        self._series._data[name][self._series._position(self._index)] = value
+
+    return property(getter, setter)
+
+
+class CandleView:
+    # Row proxy so code written against Candle (candles[-1].close, candles[-2].high, ...) keeps working.
+    __slots__ = ('_series', '_index')
+
+    def __init__(self, series, index: int):
+        self._series = series
+        self._index = index
+
+    timestamp = _column_property('timestamp')
+    open = _column_property('open')
+    high = _column_property('high')
+    low = _column_property('low')
+    close = _column_property('close')
+    volume = _column_property('volume')
+
+
+class CandleSeries:
+    # Fixed-size columnar candle store. Columns live in arrays of twice the retention window: appends go to
+    # the end, and when the end is reached the retained window is copied back to the front. The window is
+    # therefore always contiguous, so column views are zero-copy, and memory never exceeds 2 * retention rows.
+    def __init__(self, retention: int):
+        if retention < 2:
+            raise ValueError('Candle retention must be at least 2.')
+        self.retention = retention
+        size = 2 * retention
+        self._data = {name: np.zeros(size, dtype=np.int64 if name == 'timestamp' else np.float64)
+                      for name in COLUMNS}
+        # Memoryviews of the same columns for the per-trade scalar reads and writes, which cost about half as
+        # much through them as through numpy indexing. The arrays are never reallocated, so the views stay valid.
+        self._timestamp_view = memoryview(self._data['timestamp'])
+        self._high_view = memoryview(self._data['high'])
+        self._low_view = memoryview(self._data['low'])
+        self._close_view = memoryview(self._data['close'])
+        self._volume_view = memoryview(self._data['volume'])
+        self._start = 0
+        self._end = 0
+        self._base = 0  # Absolute candle number stored at buffer position 0.
+        # Bumped by clear(), so strategies sharing the series can tell it was reloaded.
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, item: int) -> CandleView:
+        length = self._end - self._start
+        if item < 0:
+            item += length
+        if not 0 <= item < length:
+            raise IndexError('Candle index out of range.')
+        return CandleView(self, self._base + self._start + item)
+
+    def _position(self, index: int) -> int:
+        position = index - self._base
+        if not self._start <= position < self._end:
+            raise IndexError('Candle is no longer retained.')
+        return position
+
+    # Column views are only valid until the next append or extend.
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self._data['timestamp'][self._start:self._end]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self._data['open'][self._start:self._end]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self._data['high'][self._start:self._end]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self._data['low'][self._start:self._end]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self._data['close'][self._start:self._end]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self._data['volume'][self._start:self._end]
+
+    @property
+    def last_timestamp(self) -> int:
+        # Rows before _start are stale buffer contents, so an empty series has no last candle to read.
+        if self._end == self._start:
+            raise IndexError('No candles.')
+        return self._timestamp_view[self._end - 1]
+
+    def live(self) -> typing.Tuple[int, float, float]:
+        # (open time, close, volume) of the live candle, as Python numbers.
+        i = self._end - 1
+        if i < self._start:
+            raise IndexError('No candles.')
+        return self._timestamp_view[i], self._close_view[i], self._volume_view[i]
+
+    def previous_range(self) -> typing.Tuple[float, float]:
+        # (high, low) of the candle before the live one, NaN if there is none yet.
+        i = self._end - 2
+        if i < self._start:
+            return float('nan'), float('nan')
+        return self._high_view[i], self._low_view[i]
+
+    def clear(self):
+        self.generation += 1
+        self._base += self._end
+        self._start = 0
+        self._end = 0
+
+    def _make_room(self, count: int):
+        # Keep at most retention rows once count more are written, then compact to the front if needed.
+        keep = min(self._end - self._start, self.retention - count)
+        self._start = self._end - keep
+        if self._end + count > len(self._data['timestamp']):
+            for column in self._data.values():
+                column[:keep] = column[self._start:self._end]
+            self._base += self._start
+            self._start = 0
+            self._end = keep
+
+    def append(self, timestamp: int, open_price: float, high: float, low: float, close: float, volume: float):
+        self._make_room(1)
+        i = self._end
+        self._data['timestamp'][i] = timestamp
+        self._data['open'][i] = open_price
+        self._data['high'][i] = high
+        self._data['low'][i] = low
+        self._data['close'][i] = close
+        self._data['volume'][i] = volume
+        self._end += 1
+
+    def extend(self, candles: typing.List[Candle]):
+        if len(candles) > self.retention:
+            candles = candles[-self.retention:]
+        count = len(candles)
+        if count == 0:
+            return
+        self._make_room(count)
+        for name in COLUMNS:
+            self._data[name][self._end:self._end + count] = [getattr(candle, name) for candle in candles]
+        self._end += count
+
+    def add_trade(self, price: float, size: float, timestamp: int, interval_ms: int) -> typing.Tuple[str, int]:
+        # Folds a trade into the live candle or opens the next one. Returns the tick type and how many candles
+        # were missing before it ('new_candle' with a gap). The first trade of an empty series opens its candle.
+        if self._end == self._start:
+            self.append(timestamp - timestamp % interval_ms, price, price, price, price, size)
+            return 'new_candle', 0
+        last_timestamp = self.last_timestamp
+        if timestamp < last_timestamp + interval_ms:
+            self.update_last(price, size)
+            return 'same_candle', 0
+
+        candle_open = last_timestamp + (timestamp - last_timestamp) // interval_ms * interval_ms
+        missing = self.fill_gap(candle_open, interval_ms)
+        self.append(candle_open, price, price, price, price, size)
+        return 'new_candle', missing
+
+    def fill_gap(self, next_timestamp: int, interval_ms: int) -> int:
+        # Flat candles at the last close, with no volume, for every open time between the last candle and
+        # next_timestamp, written column-wise in one step. At most retention - 1 are kept (the newest), leaving
+        # room for the candle that ends the gap. Returns how many were missing, including any not kept. An empty
+        # series has no gap.
+        if self._end == self._start:
+            return 0
+        last_timestamp = self.last_timestamp
+        missing = (next_timestamp - last_timestamp) // interval_ms - 1
+        if missing <= 0:
+            return 0
+        count = min(missing, self.retention - 1)
+        last_close = self._data['close'][self._end - 1]
+
+        self._make_room(count)
+        first = last_timestamp + (missing - count + 1) * interval_ms
+        end = self._end + count
+        self._data['timestamp'][self._end:end] = np.arange(first, first + count * interval_ms, interval_ms)
+        for name in ['open', 'high', 'low', 'close']:
+            self._data[name][self._end:end] = last_close
+        self._data['volume'][self._end:end] = 0
+        self._end = end
+        return missing
+
+    def update_last(self, price: float, size: float):
+        i = self._end - 1
+        self._close_view[i] = price
+        self._volume_view[i] += size
+        if price > self._high_view[i]:
+            self._high_view[i] = price
+        elif price < self._low_view[i]:
+            self._low_view[i] = price
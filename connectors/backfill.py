@@ -0,0 +1,101 @@
+import logging
+import sqlite3
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from models import *
+from strategies import timeframe_equiv
+
+logger = logging.getLogger()
+
+# Binance returns at most this many klines per request.
+PAGE_SIZE = 1000
+
+# Testnet and live klines differ, so each has its own cache.
+CANDLES_PATH = 'candles.db'
+CANDLES_TESTNET_PATH = 'candles_testnet.db'
+
+
+class HistoricalBackfill:
+    # Serves strategy history from a local SQLite cache of closed klines and only asks the exchange for what
+    # is missing: the newest candles since the last visit, and older pages if more depth is requested.
+    # Missing ranges are split into pages and fetched in parallel, at most `workers` requests at a time.
+    def __init__(self, client, db_path: str = CANDLES_PATH, workers: int = 4):
+        self._client = client
+        self._workers = workers
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS candles (symbol TEXT, interval TEXT, ts INTEGER, open REAL, "
+                         "high REAL, low REAL, close REAL, volume REAL, PRIMARY KEY (symbol, interval, ts)) "
+                         "WITHOUT ROWID")
+        self._db.commit()
+
+    def get_candles(self, contract: Contract, interval: str, depth: int = PAGE_SIZE) -> typing.List[Candle]:
+        interval_ms = timeframe_equiv(interval)
+        now = int(time.time() * 1000)
+        live_open = now - now % interval_ms
+        oldest = live_open - (depth - 1) * interval_ms
+
+        with self._lock:
+            rows = self._db.execute("SELECT ts, open, high, low, close, volume FROM candles WHERE symbol = ? AND "
+                                    "interval = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                                    (contract.symbol, interval, oldest, live_open)).fetchall()
+
+        # (start, end) ranges of open times still needed, end exclusive. The tail always includes the live candle.
+        # Holes between cached candles, left by a page that failed, are fetched again; so is a gap in the
+        # exchange's own data, such as a maintenance window, at the cost of a request that returns nothing.
+        missing = []
+        if len(rows) == 0:
+            missing.append((oldest, now + 1))
+        else:
+            if rows[0][0] > oldest:
+                missing.append((oldest, rows[0][0]))
+            for previous, row in zip(rows, rows[1:]):
+                if row[0] - previous[0] > interval_ms:
+                    missing.append((previous[0] + interval_ms, row[0]))
+            missing.append((rows[-1][0] + interval_ms, now + 1))
+
+        pages = []
+        for start, end in missing:
+            for page_start in range(start, end, PAGE_SIZE * interval_ms):
+                pages.append((page_start, min(page_start + PAGE_SIZE * interval_ms, end) - 1))
+
+        fetched: typing.List[Candle] = []
+        if len(pages) == 1:
+            fetched = self._fetch_page(contract, interval, pages[0])
+        elif len(pages) > 1:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                for page in executor.map(lambda page: self._fetch_page(contract, interval, page), pages):
+                    fetched.extend(page)
+
+        closed = [candle for candle in fetched if candle.timestamp < live_open]
+        if closed:
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [(contract.symbol, interval, candle.timestamp, candle.open, candle.high,
+                                       candle.low, candle.close, candle.volume) for candle in closed])
+                self._db.commit()
+
+        logger.info("Backfill %s %s: %d cached candles, fetched %d in %d pages.", contract.symbol, interval,
+                    len(rows), len(fetched), len(pages))
+
+        candles = {candle.timestamp: candle for candle in fetched}
+        for row in rows:
+            if row[0] not in candles:
+                candles[row[0]] = Candle(row, interval, 'Binance')
+        return [candles[ts] for ts in sorted(candles)][-depth:]
+
+    def cached_candles(self, symbol: str, interval: str) -> typing.List[Candle]:
+        # Everything cached for a symbol, oldest first, without touching the network.
+        with self._lock:
+            rows = self._db.execute("SELECT ts, open, high, low, close, volume FROM candles WHERE symbol = ? AND "
+                                    "interval = ? ORDER BY ts", (symbol, interval)).fetchall()
+        return [Candle(row, interval, 'Binance') for row in rows]
+
+    def _fetch_page(self, contract: Contract, interval: str,
+                    page: typing.Tuple[int, int]) -> typing.List[Candle]:
+        return self._client.get_historical_data(contract, interval, start_time=page[0], end_time=page[1],
+                                                limit=PAGE_SIZE)
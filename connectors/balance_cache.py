@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+import typing
+
+from models import *
+
+logger = logging.getLogger()
+
+
+class BalanceCache:
+    # Wallet balances kept current from ACCOUNT_UPDATE events, so trade sizing is a memory lookup.
+    # A REST refresh happens when the data is older than max_age (seconds). The user data stream's periodic
+    # task refreshes at half that age, so the hot path only pays for it if the background refresh fails.
+    def __init__(self, client, max_age: float = 300):
+        self._client = client
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._updated = None
+        self.balances: typing.Dict[str, Balance] = dict()
+
+    def age(self) -> float:
+        # Seconds since the balances were last confirmed, inf if they never were.
+        if self._updated is None:
+            return float('inf')
+        return time.monotonic() - self._updated
+
+    def is_stale(self) -> bool:
+        return self.age() > self.max_age
+
+    def refresh(self) -> typing.Dict[str, Balance]:
+        balances = self._client.get_balances()
+        if balances:
+            with self._lock:
+                self.balances = balances
+                self._updated = time.monotonic()
+        return self.balances
+
+    def refresh_if_stale(self):
+        if self.age() > self.max_age / 2:
+            self.refresh()
+
+    def on_account_update(self, data: typing.Dict):
+        with self._lock:
+            balances = dict(self.balances)
+            for info in data['a']['B']:
+                if info['a'] in balances:
+                    balances[info['a']].wallet_balance = float(info['wb'])
+                else:
+                    balances[info['a']] = Balance(info, 'Binance_stream')
+            self.balances = balances
+            self._updated = time.monotonic()
+
+    def get(self, asset: str) -> typing.Optional[Balance]:
+        if self.is_stale():
+            logger.warning("Balance cache is %.0f s old (limit %.0f s), refreshing over REST.", self.age(),
+                           self.max_age)
+            self.refresh()
+        return self.balances.get(asset)
@@ -5,15 +5,29 @@ import hmac
 import hashlib
 from urllib.parse import urlencode
 
-import requests
-import websocket
-import json
 import threading
 import typing
 
 import binance_keys
+import instrumentation
+import startup
+from journal import Journal, JOURNAL_PATH, JOURNAL_TESTNET_PATH
+from log_pipeline import LogBuffer
 from models import *
 from strategies import TechnicalStrategy, BreakoutStrategy
+from signal_dispatcher import SignalDispatcher
+from aggregator import CandleAggregator
+from batch_signals import SignalBatcher
+from connectors.http_session import HttpSession
+from connectors.rate_limiter import RateLimiter
+from connectors.backfill import HistoricalBackfill, CANDLES_PATH, CANDLES_TESTNET_PATH
+from connectors.price_book import PriceBook
+from connectors.metadata_cache import MetadataCache
+from connectors.balance_cache import BalanceCache
+from connectors.order_manager import OrderManager
+from connectors.user_data_stream import BinanceUserDataStream
+from connectors.ws_decoder import MessageDecoder, sniff_event
+from connectors.subscriptions import SubscriptionManager, WebsocketConnection
 
 logger = logging.getLogger()
 
@@ -31,71 +45,190 @@ class BinanceFuturesClient:
         self._secret_key = secret_key
 
         self._headers = {'X-MBX-APIKEY': self._public_key}
+        self._open_transport()
 
-        self.prices = dict()
+        # Shared weight budget for every REST call, including the backfill and the user data stream.
+        self.rate_limiter = RateLimiter()
+
+        self.prices = PriceBook()
         self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
-        self.logs = []
+        # Candles per symbol and timeframe, shared by the strategies trading them.
+        self.aggregator = CandleAggregator()
+        self._strategies_lock = threading.Lock()
+        self.dispatcher = SignalDispatcher()
+        # Indicators and signals of same-parameter TechnicalStrategies, evaluated together on candle close.
+        self.signal_batcher = SignalBatcher(self.dispatcher.submit)
+        self.backfill = HistoricalBackfill(self, CANDLES_TESTNET_PATH if testing else CANDLES_PATH)
+        # Messages for the logging panel, the most recent UI_LOG_SIZE of them.
+        self.logs = LogBuffer()
+        # Positions, orders and fills on disk. Testnet positions are kept apart from real ones.
+        self.journal = Journal(JOURNAL_TESTNET_PATH if testing else JOURNAL_PATH)
+
+        # Contracts come from the disk cache when there is one, so startup doesn't wait on exchangeInfo.
+        self.metadata = MetadataCache(self._base_url)
+        contracts = self.metadata.load()
+        if contracts is None:
+            self.contracts = self.get_contracts()
+        else:
+            self.contracts = contracts
+            if self.metadata.is_stale():
+                threading.Thread(target=self._refresh_contracts, daemon=True).start()
+        startup.mark('metadata')
+
+        # Balances are fetched in the background; get_trade_size refreshes them itself if they aren't there yet.
+        self.balance_cache = BalanceCache(self)
+        threading.Thread(target=self.balance_cache.refresh, daemon=True).start()
+
+        self.order_manager = OrderManager(self, self.journal)
+
+        self.user_stream = BinanceUserDataStream(self, self._base_wss)
+        self.user_stream.add_handler('ACCOUNT_UPDATE', self.balance_cache.on_account_update)
+        self.user_stream.add_handler('ORDER_TRADE_UPDATE', self.order_manager.on_order_update)
+        self.user_stream.add_open_handler(self.order_manager.on_stream_open)
+        self.user_stream.add_periodic_task(self.balance_cache.refresh_if_stale)
+        self.user_stream.start()
+
+        self._decoder = MessageDecoder()
+        self.feed_recorder = None
+        self._ticked = False
+        # Market streams are opened on demand by the watchlist and the active strategies.
+        self.subscriptions = SubscriptionManager(self._base_wss, self._on_message,
+                                                 connection_factory=self._new_connection)
 
-        self.contracts = self.get_contracts()
-        self.balances = self.get_balances()
+        logger.info('Initialized '+'sandbox at Binance.' if testing else 'actual trading client at Binance.')
 
-        self._ws_id = 1
-        self._ws_thread = None
+    # Transport. Everything else in the client is shared with AsyncBinanceFuturesClient, which replaces these.
 
-        logger.info('Initialized '+'sandbox at Binance.' if testing else 'actual trading client at Binance.')
+    def _open_transport(self):
+        self._session = HttpSession(self._base_url, headers=self._headers,
+                                    timeouts={'/fapi/v1/order': (3.05, 5), '/fapi/v1/klines': (3.05, 30)})
+
+    def _send(self, method: str, endpoint: str, params: typing.Dict) -> typing.Tuple[int, typing.Mapping, typing.Any]:
+        # (status code, headers, decoded JSON body)
+        response = self._session.request(method, endpoint, params)
+        return response.status_code, response.headers, response.json()
 
-        t = threading.Thread(target=self._start_websocket)
-        t.daemon = True
-        logger.debug('Thread set.')
-        t.start()
-        logger.debug('Thread running.')
+    def _new_connection(self, manager: SubscriptionManager, number: int) -> WebsocketConnection:
+        return WebsocketConnection(manager, number)
 
     def _add_log(self, msg: str):
-        # logger.debug('%s', msg)
-        self.logs.append({'log': msg, 'displayed': False})
+        self.logs.append(msg)
+
+    def add_strategy(self, strategy_id: int, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        # A strategy replaced under the same id lets go of its position first, so this one can take it over.
+        self.remove_strategy(strategy_id)
+        strategy.journal = self.journal
+        strategy.place_orders = getattr(binance_keys, 'PLACE_ORDERS', False)
+        if strategy.place_orders and self.journal.can_restore(strategy):
+            # A journalled position is only taken over if the exchange still holds it; it may have been closed
+            # by hand, or by the exchange, while the bot was down.
+            positions = self.get_positions()
+            if positions is None:
+                logger.warning("Could not get positions from the exchange: %s %s position in the journal not "
+                               "restored.", strategy.contract.symbol, type(strategy).__name__)
+            else:
+                self.journal.restore(strategy, positions.get(strategy.contract.symbol, 0.0))
+
+        with self._strategies_lock:
+            self.strategies[strategy_id] = strategy
+            self.signal_batcher.add(strategy)
+            self.aggregator.add(strategy)
+        self.subscriptions.acquire(strategy.contract.symbol, 'aggTrade')
+
+    def remove_strategy(self, strategy_id: int):
+        with self._strategies_lock:
+            strategy = self.strategies.pop(strategy_id, None)
+            if strategy is not None:
+                self._unindex_strategy(strategy)
+                self.dispatcher.forget(strategy)
+
+    def _unindex_strategy(self, strategy: typing.Union[TechnicalStrategy, BreakoutStrategy]):
+        self.subscriptions.release(strategy.contract.symbol, 'aggTrade')
+        self.aggregator.remove(strategy)
+        self.signal_batcher.remove(strategy)
+        self.journal.release(strategy)
 
     def _generate_signature(self, params: typing.Dict) -> str:
-        return hmac.new(self._secret_key.encode(), urlencode(params).encode(), hashlib.sha256).hexdigest()
+        if instrumentation.enabled:
+            start = time.perf_counter_ns()
+        signature = hmac.new(self._secret_key.encode(), urlencode(params).encode(), hashlib.sha256).hexdigest()
+        if instrumentation.enabled:
+            instrumentation.record('signature', params.get('symbol', ''), start)
+        return signature
+
+    def _sign(self, data: typing.Dict) -> typing.Dict:
+        data['timestamp'] = int(time.time() * 1000)
+        data['signature'] = self._generate_signature(data)
+        return data
 
     def _make_request(self, method: str, endpoint: str, params: typing.Dict):
+        if not self.rate_limiter.acquire(method, endpoint, params):
+            return None
+        # Timed after the rate limiter, so the span is the round trip only.
+        if instrumentation.enabled:
+            start = time.perf_counter_ns()
         try:
-            if method == 'GET':
-                response = requests.get(self._base_url+endpoint, params=params, headers=self._headers)
-            elif method == 'POST':
-                response = requests.post(self._base_url + endpoint, params=params, headers=self._headers)
-            elif method == 'DELETE':
-                response = requests.delete(self._base_url + endpoint, params=params, headers=self._headers)
-            else:
-                raise ValueError()
+            status_code, headers, body = self._send(method, endpoint, params)
         except Exception as e:
             logger.error('Error while making %s request to %s: %s',
                          method, endpoint, e)
             return None
+        if instrumentation.enabled:
+            instrumentation.record('rest', f"{method} {endpoint}", start)
+        return self._response(method, endpoint, status_code, headers, body)
+
+    def _response(self, method: str, endpoint: str, status_code: int, headers: typing.Mapping, body):
+        self.rate_limiter.update(status_code, headers)
 
-        if response.status_code == 200:
-            return response.json()
+        if status_code == 200:
+            return body
         else:
             logger.error('Error while making %s request to %s: %s (%d)',
-                         method, endpoint, response.json(), response.status_code)
+                         method, endpoint, body, status_code)
             return None
 
+    # Each REST call is a request builder and a result handler, shared with the coroutine versions of the async
+    # client, with the blocking call in between.
+
     def get_contracts(self) -> typing.Dict[str, Contract]:
-        exchange_info = self._make_request('GET', '/fapi/v1/exchangeInfo', dict())
+        return self._contracts_result(self._make_request('GET', '/fapi/v1/exchangeInfo', dict()))
 
+    def _contracts_result(self, exchange_info) -> typing.Dict[str, Contract]:
         contracts = dict()
         if exchange_info is not None:
             for contract in exchange_info['symbols']:
                 contracts[contract['symbol']] = Contract(contract, 'Binance')
+            self.metadata.save(exchange_info['symbols'])
 
         return contracts
 
-    def get_historical_data(self, contract: Contract, interval: str) -> typing.List[Candle]:
+    def _refresh_contracts(self):
+        contracts = self.get_contracts()
+        if contracts:
+            # Swapped whole, so readers see either the old or the new dict.
+            self.contracts = contracts
+            logger.info('Refreshed metadata for %d contracts.', len(contracts))
+
+    def get_historical_data(self, contract: Contract, interval: str, start_time: typing.Optional[int] = None,
+                            end_time: typing.Optional[int] = None, limit: int = 1000) -> typing.List[Candle]:
+        params = self._klines_params(contract, interval, start_time, end_time, limit)
+        return self._candles_result(self._make_request('GET', '/fapi/v1/klines', params), interval)
+
+    @staticmethod
+    def _klines_params(contract: Contract, interval: str, start_time: typing.Optional[int],
+                       end_time: typing.Optional[int], limit: int) -> typing.Dict:
         params = dict()
         params['symbol'] = contract.symbol
         params['interval'] = interval
-        params['limit'] = 1000
-
-        response = self._make_request('GET', '/fapi/v1/klines', params)
+        if start_time is not None:
+            params['startTime'] = start_time
+        if end_time is not None:
+            params['endTime'] = end_time
+        params['limit'] = limit
+        return params
+
+    @staticmethod
+    def _candles_result(response, interval: str) -> typing.List[Candle]:
         candles = []
 
         if response is not None:
@@ -104,35 +237,50 @@ class BinanceFuturesClient:
         return candles
 
     def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
-        params = dict()
-        params['symbol'] = contract.symbol
-        response = self._make_request('GET', '/fapi/v1/ticker/bookTicker', params)
+        response = self._make_request('GET', '/fapi/v1/ticker/bookTicker', {'symbol': contract.symbol})
+        return self._bid_ask_result(contract, response)
 
+    def _bid_ask_result(self, contract: Contract, response) -> typing.Optional[typing.Dict[str, float]]:
         if response is not None:
-            if contract.symbol not in self.prices:
-                self.prices[contract.symbol] = {'bid': float(response['bidPrice']),
-                                                'ask': float(response['askPrice'])}
-            else:
-                self.prices[contract.symbol]['bid'] = float(response['bidPrice'])
-                self.prices[contract.symbol]['ask'] = float(response['askPrice'])
-
+            # Only fills symbols without a stream quote yet; once streamed, the stream is the fresher source.
+            self.prices.seed(contract.symbol, float(response['bidPrice']), float(response['askPrice']))
             return self.prices[contract.symbol]
 
     def get_balances(self) -> typing.Dict[str, Balance]:
-        data = dict()
-        data['timestamp'] = int(time.time() * 1000)
-        data['signature'] = self._generate_signature(data)
+        return self._balances_result(self._make_request('GET', '/fapi/v1/account', self._sign(dict())))
 
+    @staticmethod
+    def _balances_result(account_data) -> typing.Dict[str, Balance]:
         balances = dict()
 
-        account_data = self._make_request('GET', '/fapi/v1/account', data)
-
         if account_data:
             for asset in account_data['assets']:
                 balances[asset['asset']] = Balance(asset, 'Binance')
         return balances
 
-    def place_order(self, contract: Contract, side: str, quantity: float, order_type: str, price=None, tif=None) -> OrderStatus:
+    def get_positions(self) -> typing.Optional[typing.Dict[str, float]]:
+        return self._positions_result(self._make_request('GET', '/fapi/v2/positionRisk', self._sign(dict())))
+
+    @staticmethod
+    def _positions_result(response) -> typing.Optional[typing.Dict[str, float]]:
+        # Signed position amount per symbol, for symbols with a position. None if the request failed, which is
+        # not the same as holding nothing.
+        if response is None:
+            return None
+        positions = dict()
+        for position in response:
+            amount = float(position['positionAmt'])
+            if amount != 0:
+                positions[position['symbol']] = positions.get(position['symbol'], 0.0) + amount
+        return positions
+
+    def place_order(self, contract: Contract, side: str, quantity: float, order_type: str, price=None, tif=None,
+                    reduce_only: bool = False) -> OrderStatus:
+        params = self._order_params(contract, side, quantity, order_type, price, tif, reduce_only)
+        return self._order_result(self._make_request('POST', '/fapi/v1/order', params))
+
+    def _order_params(self, contract: Contract, side: str, quantity: float, order_type: str, price=None,
+                      tif=None, reduce_only: bool = False) -> typing.Dict:
         data = dict()
         data['symbol'] = contract.symbol
         data['side'] = side
@@ -142,125 +290,94 @@ class BinanceFuturesClient:
             data['price'] = round(round(price / contract.tick_size) * contract.tick_size, 8)
         if tif is not None:
             data['timeInForce'] = tif
-        data['timestamp'] = int(time.time() * 1000)
-        data['signature'] = self._generate_signature(data)
-
-        status = self._make_request('POST', '/fapi/v1/order', data)
+        if reduce_only:
+            # Rejected by the exchange rather than opening a position the other way if this one is gone.
+            data['reduceOnly'] = 'true'
+        return self._sign(data)
 
+    def _order_result(self, status) -> typing.Optional[OrderStatus]:
         if status is not None:
             status = OrderStatus(status)
+            self.order_manager.track(status)
 
         return status
 
     def cancel_order(self, contract: Contract, order_id: int) -> OrderStatus:
-        data = dict()
-        data['orderId'] = order_id
-        data['symbol'] = contract.symbol
-        data['timestamp'] = int(time.time() * 1000)
-        data['signature'] = self._generate_signature(data)
+        params = self._sign({'orderId': order_id, 'symbol': contract.symbol})
+        return self._order_result(self._make_request('DELETE', '/fapi/v1/order', params))
 
-        status = self._make_request('DELETE', '/fapi/v1/order', data)
+    def get_order_status(self, contract: Contract, order_id: int, use_cache: bool = True) -> OrderStatus:
+        # Orders placed by this client are kept current by the user data stream; REST is only used while the
+        # stream is down or for orders the client doesn't know.
+        cached = self._cached_order(order_id) if use_cache else None
+        if cached is not None:
+            return cached
 
-        if status is not None:
-            status = OrderStatus(status)
+        params = self._sign({'symbol': contract.symbol, 'orderId': order_id})
+        return self._order_result(self._make_request('GET', '/fapi/v1/order', params))
 
-        return status
-
-    def get_order_status(self, contract: Contract, order_id: int) -> OrderStatus:
-        data = dict()
-        data['timestamp'] = int(time.time() * 1000)
-        data['symbol'] = contract.symbol
-        data['orderId'] = order_id
-        data['signature'] = self._generate_signature(data)
-
-        status = self._make_request('GET', '/fapi/v1/order', data)
-
-        if status is not None:
-            status = OrderStatus(status)
-
-        return status
+    def _cached_order(self, order_id: int) -> typing.Optional[OrderStatus]:
+        if self.user_stream.connected and self.order_manager.synced:
+            return self.order_manager.get(order_id)
+        return None
 
     def get_open_orders(self):
-        data = dict()
-        data['timestamp'] = int(time.time() * 1000)
-        data['signature'] = self._generate_signature(data)
-
-        status = self._make_request('GET', '/fapi/v1/openOrders', data)
-
-        return status
-
-    def _start_websocket(self):
-        self.ws_thread = websocket.WebSocketApp(self._base_wss, on_open=self._on_open, on_error=self._on_error,
-                                                on_close=self._on_close, on_message=self._on_message)
-        while True:
-            try:
-                self.ws_thread.run_forever()
-            except Exception as e:
-                logger.error('Lost connection to Websocket: %s', e)
-                self.ws_thread.close()
-            time.sleep(2.0)
-
-    def _on_open(self, ws):
-        # logger.info("Opened websocket: %s", self._base_wss)
-        self.subscribe_to_channel(list(self.contracts.values()), 'bookTicker')
-        # self.subscribe_to_channel(list(self.contracts.values()), 'aggTrade')
-        return
-
-    def _on_error(self, ws, msg: str):
-        logger.error("Websocket error on %s: %s", self._base_wss, msg)
-        return
-
-    def _on_close(self, ws):
-        logger.warning("Websocket %s closed.", self._base_wss)
-        return
+        return self._make_request('GET', '/fapi/v1/openOrders', self._sign(dict()))
 
     def _on_message(self, ws, msg: str):
-        data = json.loads(msg)
-
-        if "e" in data:
-            if data['e'] == 'bookTicker':
-                symbol = data['s']
-                if symbol not in self.prices:
-                    self.prices[symbol] = {'bid': float(data['b']),
-                                           'ask': float(data['a'])}
-                else:
-                    self.prices[symbol]['bid'] = float(data['b'])
-                    self.prices[symbol]['ask'] = float(data['a'])
-            elif data['e'] == 'aggTrade':
-
-                symbol = data['s']
-                for key, strat in self.strategies.items():
-                    if strat.contract.symbol == symbol:
-                        res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])
-                        strat.check_trade(res)
+        if self.feed_recorder is not None:
+            self.feed_recorder.write(msg)
+
+        timed = instrumentation.enabled
+        if timed:
+            received = time.perf_counter_ns()
+
+        event_type = sniff_event(msg)
+        data = None
+        if event_type is None:
+            # Acks, errors, or an event whose keys aren't laid out as sniff_event expects: decode it to find out.
+            data = self._decoder.loads(msg)
+            event_type = data.get('e') if isinstance(data, dict) else None
+            if event_type is None:
+                return
+        if not self._decoder.wants(event_type):
+            return
+        if not self._ticked:
+            self._ticked = True
+            startup.mark('first_tick')
+
+        if event_type == 'bookTicker':
+            if data is None:
+                symbol, bid, ask = self._decoder.book_ticker(msg)
+            else:
+                symbol, bid, ask = data['s'], float(data['b']), float(data['a'])
+            if timed:
+                instrumentation.record('decode', event_type, received)
+            self.prices.update(symbol, bid, ask)
+        elif event_type == 'aggTrade':
+            if data is None:
+                data = self._decoder.loads(msg)
+            if timed:
+                instrumentation.record('decode', event_type, received)
+            # With spans on, the receive time starts each strategy's tick-to-order span.
+            self.aggregator.on_trade(data['s'], float(data['p']), float(data['q']), data['T'], self.dispatcher.submit,
+                                     received if timed else 0)
         return
 
     def subscribe_to_channel(self, contracts: typing.List[Contract], channel: str):
-        data = dict()
-        data['method'] = 'SUBSCRIBE'
-        data['params'] = []
-
         for contract in contracts:
-            data['params'].append(contract.symbol.lower()+'@'+channel)
-            data['id'] = self._ws_id
-            self._ws_id += 1
+            self.subscriptions.acquire(contract.symbol, channel)
 
-        try:
-            self.ws_thread.send(json.dumps(data))
-        except Exception as e:
-            logger.error('Error while subscribing to %d feeds of %s: %s', channel, len(contracts), e)
-        return
+    def unsubscribe_from_channel(self, contracts: typing.List[Contract], channel: str):
+        for contract in contracts:
+            self.subscriptions.release(contract.symbol, channel)
 
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
-        balance = self.get_balances()
-        if balance is not None:
-            if 'USDT' in balance:
-                balance = balance['USDT'].wallet_balance
-            else:
-                return None
-        else:
+        balance = self.balance_cache.get('USDT')
+        if balance is None:
             return None
+        balance = balance.wallet_balance
 
         trade_size = (balance * balance_pct / 100) / price
 
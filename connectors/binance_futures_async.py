@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import threading
+import time
+import typing
+
+import aiohttp
+
+import instrumentation
+from models import *
+from connectors.binance_futures import BinanceFuturesClient
+from connectors.subscriptions import SubscriptionManager, WebsocketConnection
+
+logger = logging.getLogger()
+
+
+class AsyncBinanceFuturesClient(BinanceFuturesClient):
+    # BinanceFuturesClient with REST and the market websockets on one asyncio event loop, so one process can
+    # serve hundreds of symbols without a thread per connection or a blocked thread per request. Strategies,
+    # subscriptions, message handling, sizing, orders and the journal are the base client's; only the transport
+    # differs. The loop runs on its own daemon thread.
+    # The blocking methods (get_contracts, place_order, ...) work from any other thread, which is how the Tk UI,
+    # the signal workers and the caches use them. Code running on the loop awaits the coroutine versions:
+    # aget_contracts, aget_historical_data, aget_bid_ask, aget_balances, aget_positions, aplace_order,
+    # acancel_order, aget_order_status and aget_open_orders.
+    def __init__(self, public_key: str, secret_key: str, testing: bool, pool_size: int = 100,
+                 timeout: float = 30):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        super().__init__(public_key, secret_key, testing)
+
+    def _open_transport(self):
+        self._loop = asyncio.new_event_loop()
+        t = threading.Thread(target=self._loop.run_forever, name='binance-async-loop')
+        t.daemon = True
+        t.start()
+        self._loop_thread = t
+        self._http: aiohttp.ClientSession = self._run(self._open_session())
+
+    async def _open_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(headers=self._headers, connector=aiohttp.TCPConnector(limit=self._pool_size),
+                                     timeout=aiohttp.ClientTimeout(total=10))
+
+    def _run(self, coroutine):
+        # Waits for a coroutine on the loop. From the loop's own thread that would never return.
+        if threading.current_thread() is self._loop_thread:
+            coroutine.close()
+            raise RuntimeError('Blocking client call on the event loop; await the a-prefixed method instead.')
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(self._timeout)
+
+    def _send(self, method: str, endpoint: str, params: typing.Dict) -> typing.Tuple[int, typing.Mapping, typing.Any]:
+        return self._run(self._send_async(method, endpoint, params))
+
+    async def _send_async(self, method: str, endpoint: str,
+                          params: typing.Dict) -> typing.Tuple[int, typing.Mapping, typing.Any]:
+        # Send values exactly as they were signed (urlencode uses str()).
+        query = {key: str(value) for key, value in params.items()}
+        async with self._http.request(method, self._base_url + endpoint, params=query) as response:
+            return response.status, response.headers, await response.json(content_type=None)
+
+    def _new_connection(self, manager: SubscriptionManager, number: int) -> WebsocketConnection:
+        return AsyncWebsocketConnection(manager, number, self._loop, self._http)
+
+    def close(self):
+        self._run(self._http.close())
+
+    async def _make_request_async(self, method: str, endpoint: str, params: typing.Dict):
+        # _make_request for code running on the loop.
+        if not await self.rate_limiter.acquire_async(method, endpoint, params):
+            return None
+        if instrumentation.enabled:
+            start = time.perf_counter_ns()
+        try:
+            status_code, headers, body = await self._send_async(method, endpoint, params)
+        except Exception as e:
+            logger.error('Error while making %s request to %s: %s', method, endpoint, e)
+            return None
+        if instrumentation.enabled:
+            instrumentation.record('rest', f"{method} {endpoint}", start)
+        return self._response(method, endpoint, status_code, headers, body)
+
+    async def aget_contracts(self) -> typing.Dict[str, Contract]:
+        return self._contracts_result(await self._make_request_async('GET', '/fapi/v1/exchangeInfo', dict()))
+
+    async def aget_historical_data(self, contract: Contract, interval: str, start_time: typing.Optional[int] = None,
+                                   end_time: typing.Optional[int] = None, limit: int = 1000) -> typing.List[Candle]:
+        params = self._klines_params(contract, interval, start_time, end_time, limit)
+        return self._candles_result(await self._make_request_async('GET', '/fapi/v1/klines', params), interval)
+
+    async def aget_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
+        response = await self._make_request_async('GET', '/fapi/v1/ticker/bookTicker', {'symbol': contract.symbol})
+        return self._bid_ask_result(contract, response)
+
+    async def aget_balances(self) -> typing.Dict[str, Balance]:
+        return self._balances_result(await self._make_request_async('GET', '/fapi/v1/account', self._sign(dict())))
+
+    async def aget_positions(self) -> typing.Optional[typing.Dict[str, float]]:
+        return self._positions_result(await self._make_request_async('GET', '/fapi/v2/positionRisk',
+                                                                     self._sign(dict())))
+
+    async def aplace_order(self, contract: Contract, side: str, quantity: float, order_type: str, price=None,
+                           tif=None, reduce_only: bool = False) -> OrderStatus:
+        params = self._order_params(contract, side, quantity, order_type, price, tif, reduce_only)
+        return self._order_result(await self._make_request_async('POST', '/fapi/v1/order', params))
+
+    async def acancel_order(self, contract: Contract, order_id: int) -> OrderStatus:
+        params = self._sign({'orderId': order_id, 'symbol': contract.symbol})
+        return self._order_result(await self._make_request_async('DELETE', '/fapi/v1/order', params))
+
+    async def aget_order_status(self, contract: Contract, order_id: int, use_cache: bool = True) -> OrderStatus:
+        cached = self._cached_order(order_id) if use_cache else None
+        if cached is not None:
+            return cached
+        params = self._sign({'symbol': contract.symbol, 'orderId': order_id})
+        return self._order_result(await self._make_request_async('GET', '/fapi/v1/order', params))
+
+    async def aget_open_orders(self):
+        return await self._make_request_async('GET', '/fapi/v1/openOrders', self._sign(dict()))
+
+
+class AsyncWebsocketConnection(WebsocketConnection):
+    # A SubscriptionManager connection running as a task on the client's event loop instead of on a thread.
+    def __init__(self, manager: SubscriptionManager, number: int, loop: asyncio.AbstractEventLoop,
+                 http: aiohttp.ClientSession, send_timeout: float = 10):
+        self._loop = loop
+        self._http = http
+        self._send_timeout = send_timeout
+        super().__init__(manager, number)
+
+    def _start(self):
+        asyncio.run_coroutine_threadsafe(self._run_async(), self._loop)
+
+    def send(self, payload: str):
+        # Called from the manager's flusher thread; a failure raises there, so the streams are queued again.
+        if self.ws is None:
+            raise ConnectionError('not connected')
+        asyncio.run_coroutine_threadsafe(self.ws.send_str(payload), self._loop).result(self._send_timeout)
+
+    async def _run_async(self):
+        while True:
+            try:
+                async with self._http.ws_connect(self._manager.base_wss, heartbeat=30) as ws:
+                    self.ws = ws
+                    self._on_open()
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            try:
+                                self._manager.on_message(ws, msg.data)
+                            except Exception as e:
+                                # As websocket-client does: log it and keep the connection.
+                                logger.error('Error while handling a message on websocket %d: %s', self.number, e)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            self._on_error(ws, ws.exception())
+                            break
+                self._on_close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error('Lost connection to Websocket %d: %s', self.number, e)
+            self.ws = None
+            self.open = False
+            await asyncio.sleep(2.0)
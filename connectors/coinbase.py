@@ -7,7 +7,6 @@ import hashlib
 from urllib.parse import urlencode
 import base64
 
-import requests
 import websocket
 import json
 import threading
@@ -15,6 +14,7 @@ import typing
 import logging
 from requests.auth import AuthBase
 from strategies import TechnicalStrategy, BreakoutStrategy
+from connectors.http_session import HttpSession
 logger = logging.getLogger()
 
 
@@ -55,6 +55,7 @@ class CoinBaseFuturesClient:
         self._secret_key = secret_key
         self._passphrase = passphrase
         self._auth = CoinbaseExchangeAuth(self._public_key, self._secret_key, self._passphrase)
+        self._session = HttpSession(self._base_url, auth=self._auth)
         self._ws_thread = None
         self._ws_id = 1
 
@@ -72,14 +73,7 @@ class CoinBaseFuturesClient:
 
     def _make_request(self, method: str, endpoint: str, params: typing.Dict):
         try:
-            if method == 'GET':
-                response = requests.get(self._base_url + endpoint, params=params, headers=self._headers)
-            elif method == 'POST':
-                response = requests.post(self._base_url + endpoint, params=params, headers=self._headers)
-            elif method == 'DELETE':
-                response = requests.delete(self._base_url + endpoint, params=params, headers=self._headers)
-            else:
-                raise ValueError()
+            response = self._session.request(method, endpoint, params)
         except Exception as e:
             logger.error('Error while making %s request to %s: %s',
                          method, endpoint, e)
@@ -94,7 +88,7 @@ class CoinBaseFuturesClient:
 
     def get_contracts(self):
         logger.debug('Getting user.')
-        r = requests.get(self._base_url + '/user', auth=self._auth)
+        r = self._session.request('GET', '/user')
         logger.debug('Received user.')
         print(r.json())
         return []
@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+from models import *
+
+logger = logging.getLogger()
+
+# exchangeInfo changes when symbols are listed or delisted, which is rare next to how often the bot starts.
+METADATA_TTL = 6 * 60 * 60
+
+# The exchangeInfo fields Contract reads. Only these are cached, which keeps the file small and quick to parse.
+CONTRACT_FIELDS = ['symbol', 'baseAsset', 'quoteAsset', 'pricePrecision', 'quantityPrecision']
+
+
+class MetadataCache:
+    # Contract metadata on disk, one entry per base URL so sandbox and live don't mix. Clients start from the
+    # cached copy and refresh it in the background once it is older than the TTL; only the very first start
+    # waits for exchangeInfo.
+    def __init__(self, base_url: str, path: str = 'exchange_info.json', ttl: float = METADATA_TTL):
+        self._base_url = base_url
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.fetched = 0.0
+
+    def load(self) -> typing.Optional[typing.Dict[str, Contract]]:
+        try:
+            with open(self._path, encoding='utf-8') as f:
+                entry = json.load(f).get(self._base_url)
+        except (OSError, ValueError) as e:
+            logger.info('No usable exchange metadata cache in %s: %s', self._path, e)
+            return None
+        if not entry:
+            return None
+
+        self.fetched = entry['fetched']
+        return {info['symbol']: Contract(info, 'Binance') for info in entry['symbols']}
+
+    def save(self, symbols: typing.List[typing.Dict]):
+        entry = {'fetched': time.time(),
+                 'symbols': [{field: info[field] for field in CONTRACT_FIELDS} for info in symbols]}
+        with self._lock:
+            try:
+                with open(self._path, encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = dict()
+            cache[self._base_url] = entry
+
+            # Written to a temporary file and renamed, so a crash mid-write never leaves a broken cache.
+            temp_path = self._path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(temp_path, self._path)
+        self.fetched = entry['fetched']
+
+    def age(self) -> float:
+        return time.time() - self.fetched
+
+    def is_stale(self) -> bool:
+        return self.age() > self._ttl
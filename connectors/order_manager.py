@@ -0,0 +1,119 @@
+import collections
+import logging
+import threading
+import time
+import typing
+
+from models import *
+
+logger = logging.getLogger()
+
+# Statuses after which an order never changes again.
+FINAL_STATUSES = {'FILLED', 'CANCELED', 'EXPIRED', 'REJECTED'}
+
+# Finished orders kept for lookups before the oldest are dropped.
+MAX_FINISHED_ORDERS = 1000
+
+# A reconcile that fails is tried again after RECONCILE_BACKOFF seconds, doubling up to RECONCILE_MAX_BACKOFF.
+RECONCILE_BACKOFF = 1.0
+RECONCILE_MAX_BACKOFF = 60.0
+
+
+class OrderManager:
+    # In-memory order table keyed by orderId, kept current by ORDER_TRADE_UPDATE events from the user data
+    # stream, so order status is a lookup instead of a signed REST poll. Orders enter the table from the
+    # place/cancel responses and from the stream, whichever arrives first; an update never replaces a newer one.
+    # Events missed while the stream was down are recovered on reconnect with one openOrders request, plus a
+    # status query for each order that was open and no longer is. With a journal, new orders and fills are
+    # recorded as they are first seen.
+    def __init__(self, client, journal=None):
+        self._client = client
+        self._journal = journal
+        self._lock = threading.Lock()
+        self.orders: typing.Dict[int, OrderStatus] = dict()
+        self._finished: typing.Deque[int] = collections.deque()
+        # False while a reconnect is being reconciled, when the table may be missing updates.
+        self.synced = True
+        # Reconnects seen; a reconcile still retrying gives up once a newer one has started.
+        self._reconnects = 0
+
+    def get(self, order_id: int) -> typing.Optional[OrderStatus]:
+        return self.orders.get(order_id)
+
+    def open_orders(self) -> typing.List[OrderStatus]:
+        return [order for order in list(self.orders.values()) if order.status not in FINAL_STATUSES]
+
+    def track(self, order_status: typing.Optional[OrderStatus]):
+        # REST responses from place_order, cancel_order and get_order_status.
+        if order_status is not None:
+            self._store(order_status)
+
+    def on_order_update(self, data: typing.Dict):
+        self._store(OrderStatus(data['o'], 'Binance_stream'))
+
+    def on_stream_open(self, reconnect: bool):
+        if reconnect:
+            self.synced = False
+            self._reconnects += 1
+            threading.Thread(target=self.reconcile, args=(self._reconnects,), daemon=True).start()
+
+    def reconcile(self, reconnect: typing.Optional[int] = None):
+        # Until it succeeds the table stays unsynced, so order status keeps coming from REST.
+        delay = RECONCILE_BACKOFF
+        while not self._reconcile():
+            if reconnect is not None and reconnect != self._reconnects:
+                return
+            logger.error('Could not reconcile orders after the user data stream reconnected, retrying in %.0f s.',
+                         delay)
+            time.sleep(delay)
+            delay = min(delay * 2, RECONCILE_MAX_BACKOFF)
+            if reconnect is not None and reconnect != self._reconnects:
+                return
+
+    def _reconcile(self) -> bool:
+        open_orders = self._client.get_open_orders()
+        if open_orders is None:
+            return False
+
+        still_open = set()
+        for data in open_orders:
+            order_status = OrderStatus(data)
+            still_open.add(order_status.order_id)
+            self._store(order_status)
+
+        # Orders that finished while the stream was down.
+        for order in self.open_orders():
+            if order.order_id not in still_open and order.symbol in self._client.contracts:
+                contract = self._client.contracts[order.symbol]
+                if self._client.get_order_status(contract, order.order_id, use_cache=False) is None:
+                    return False
+        self.synced = True
+        logger.info('Reconciled orders after reconnect: %d open.', len(still_open))
+        return True
+
+    def _store(self, order_status: OrderStatus):
+        with self._lock:
+            current = self.orders.get(order_status.order_id)
+            if self._journal is not None:
+                if current is None:
+                    self._journal.order(order_status)
+                if order_status.executed_quantity > (current.executed_quantity if current is not None else 0):
+                    self._journal.fill(order_status)
+            if current is not None:
+                # The REST response to place_order can arrive after the stream has already reported the fill.
+                if _progress(order_status) < _progress(current):
+                    return
+                if current.status in FINAL_STATUSES:
+                    self.orders[order_status.order_id] = order_status
+                    return
+
+            self.orders[order_status.order_id] = order_status
+            if order_status.status in FINAL_STATUSES:
+                self._finished.append(order_status.order_id)
+                while len(self._finished) > MAX_FINISHED_ORDERS:
+                    self.orders.pop(self._finished.popleft(), None)
+
+
+def _progress(order_status: OrderStatus) -> typing.Tuple[int, float, bool]:
+    # Orders only move forward: later updates, more filled, finished.
+    return order_status.update_time, order_status.executed_quantity, order_status.status in FINAL_STATUSES
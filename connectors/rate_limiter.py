@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+# Binance futures limits: request weight per IP per minute, and orders per account per 10 s and per minute.
+WEIGHT_LIMIT_1M = 2400
+ORDER_LIMIT_10S = 300
+ORDER_LIMIT_1M = 1200
+
+# Share of the weight budget that data requests may not use, kept for order traffic.
+ORDER_RESERVE = 0.2
+
+# Requests that would wait longer than this for budget are dropped instead.
+MAX_WAIT = 10.0
+
+# Requests that count against the order limits and may use the reserve. Order status queries are data requests.
+ORDER_REQUESTS = {('POST', '/fapi/v1/order'), ('DELETE', '/fapi/v1/order')}
+
+# Weight by (method, endpoint). Endpoints not listed weigh 1.
+ENDPOINT_WEIGHTS = {
+    ('GET', '/fapi/v1/exchangeInfo'): 1,
+    ('GET', '/fapi/v1/ticker/bookTicker'): 2,
+    ('GET', '/fapi/v1/account'): 5,
+    ('GET', '/fapi/v2/account'): 5,
+    ('GET', '/fapi/v2/balance'): 5,
+    ('GET', '/fapi/v2/positionRisk'): 5,
+    ('GET', '/fapi/v1/order'): 1,
+    ('POST', '/fapi/v1/order'): 0,  # Orders only count against the order limits.
+    ('DELETE', '/fapi/v1/order'): 1,
+    ('GET', '/fapi/v1/openOrders'): 1,
+    ('POST', '/fapi/v1/listenKey'): 1,
+    ('PUT', '/fapi/v1/listenKey'): 1,
+}
+
+
+def endpoint_weight(method: str, endpoint: str, params: typing.Optional[typing.Dict] = None) -> int:
+    if endpoint == '/fapi/v1/klines':
+        limit = int(params.get('limit', 500)) if params else 500
+        if limit < 100:
+            return 1
+        elif limit < 500:
+            return 2
+        elif limit <= 1000:
+            return 5
+        return 10
+    if endpoint == '/fapi/v1/ticker/bookTicker' and not (params and 'symbol' in params):
+        return 5
+    if endpoint == '/fapi/v1/openOrders' and not (params and 'symbol' in params):
+        return 40
+    return ENDPOINT_WEIGHTS.get((method, endpoint), 1)
+
+
+class _Bucket:
+    # Tokens refill continuously at capacity per period. Server counters can only lower the level, so the
+    # bucket never runs ahead of what the exchange has counted, including other processes on the same IP.
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float, floor: float) -> float:
+        # Seconds until `amount` can be taken while leaving `floor` tokens.
+        missing = amount + floor - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def clamp(self, used: float):
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RateLimiter:
+    # Client-side governor in front of _make_request. Each request takes its endpoint weight from a token
+    # bucket before it is sent. Order requests also take from the 10 s and 1 min order buckets. Data requests
+    # may not dip into the last ORDER_RESERVE of the weight budget, so orders still go out when backfills and
+    # quote requests have used up the rest. Response headers (X-MBX-USED-WEIGHT-1M, X-MBX-ORDER-COUNT-10S/1M)
+    # correct the buckets, and a 429/418 pauses everything until its Retry-After.
+    def __init__(self, weight_limit: int = WEIGHT_LIMIT_1M, order_limit_10s: int = ORDER_LIMIT_10S,
+                 order_limit_1m: int = ORDER_LIMIT_1M, order_reserve: float = ORDER_RESERVE,
+                 max_wait: float = MAX_WAIT):
+        self._weight = _Bucket(weight_limit, 60)
+        self._orders_10s = _Bucket(order_limit_10s, 10)
+        self._orders_1m = _Bucket(order_limit_1m, 60)
+        self._reserve = weight_limit * order_reserve
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+
+        self._blocked_until = 0.0
+        self.server_weight = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rejected = 0
+
+    def acquire(self, method: str, endpoint: str, params: typing.Optional[typing.Dict] = None) -> bool:
+        # Blocks until the request fits the budget. False if it would have to wait longer than max_wait.
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(method, endpoint, params, waited)
+            if delay is None:
+                return False
+            if delay == 0:
+                return True
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, method: str, endpoint: str, params: typing.Optional[typing.Dict] = None) -> bool:
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(method, endpoint, params, waited)
+            if delay is None:
+                return False
+            if delay == 0:
+                return True
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def _try_acquire(self, method: str, endpoint: str, params: typing.Optional[typing.Dict],
+                     waited: float) -> typing.Optional[float]:
+        # 0 when the tokens were taken, seconds to wait otherwise, None to give up.
+        weight = endpoint_weight(method, endpoint, params)
+        is_order = (method, endpoint) in ORDER_REQUESTS
+        with self._lock:
+            now = time.monotonic()
+            for bucket in [self._weight, self._orders_10s, self._orders_1m]:
+                bucket.refill(now)
+
+            delay = max(self._blocked_until - now, self._weight.wait_for(weight, 0 if is_order else self._reserve))
+            if is_order:
+                delay = max(delay, self._orders_10s.wait_for(1, 0), self._orders_1m.wait_for(1, 0))
+
+            if delay <= 0:
+                self._weight.tokens -= weight
+                if is_order:
+                    self._orders_10s.tokens -= 1
+                    self._orders_1m.tokens -= 1
+                return 0.0
+
+            if waited + delay > self._max_wait:
+                self.rejected += 1
+                logger.warning('Rate limit budget exhausted, dropping %s %s.', method, endpoint)
+                return None
+            if waited == 0:
+                self.waits += 1
+            # Short sleeps, so a header that frees budget or a lifted block is noticed quickly.
+            delay = min(delay, 1.0)
+            self.wait_time += delay
+            return delay
+
+    def update(self, status_code: int, headers: typing.Mapping[str, str]):
+        with self._lock:
+            used = headers.get('X-MBX-USED-WEIGHT-1M')
+            if used is not None:
+                self.server_weight = int(used)
+                self._weight.clamp(self.server_weight)
+            orders = headers.get('X-MBX-ORDER-COUNT-10S')
+            if orders is not None:
+                self._orders_10s.clamp(int(orders))
+            orders = headers.get('X-MBX-ORDER-COUNT-1M')
+            if orders is not None:
+                self._orders_1m.clamp(int(orders))
+
+            if status_code in (418, 429):
+                retry_after = float(headers.get('Retry-After', 60))
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                self._weight.tokens = min(self._weight.tokens, 0)
+                logger.error('Binance rate limit hit (%d), pausing requests for %.0f s.', status_code, retry_after)
+
+    def metrics(self) -> typing.Dict[str, float]:
+        with self._lock:
+            now = time.monotonic()
+            for bucket in [self._weight, self._orders_10s, self._orders_1m]:
+                bucket.refill(now)
+            return {
+                'weight_available': round(self._weight.tokens, 1),
+                'weight_limit': self._weight.capacity,
+                'data_weight_available': round(max(0.0, self._weight.tokens - self._reserve), 1),
+                'server_weight_1m': self.server_weight,
+                'orders_10s_available': round(self._orders_10s.tokens, 1),
+                'orders_1m_available': round(self._orders_1m.tokens, 1),
+                'blocked_for_s': round(max(0.0, self._blocked_until - now), 1),
+                'waits': self.waits,
+                'wait_time_s': round(self.wait_time, 3),
+                'rejected': self.rejected,
+            }
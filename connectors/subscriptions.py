@@ -0,0 +1,187 @@
+import logging
+import time
+
+import websocket
+import json
+import threading
+import typing
+
+import startup
+
+logger = logging.getLogger()
+
+# Binance futures limits: 200 streams per connection and 10 incoming messages per second per connection.
+# The message budget is kept below the limit on purpose.
+MAX_STREAMS_PER_CONNECTION = 200
+MAX_MESSAGES_PER_SECOND = 5
+MAX_STREAMS_PER_MESSAGE = 100
+
+
+class WebsocketConnection:
+    # One market stream connection, on its own websocket-client thread. Other transports subclass it and
+    # replace _start and send; the bookkeeping in _on_open and _on_close is shared.
+    def __init__(self, manager, number: int):
+        self.number = number
+        self.streams: typing.Set[str] = set()  # Streams this connection should carry.
+        self.live: typing.Set[str] = set()  # Streams already subscribed on the wire.
+        self.pending: typing.Dict[str, str] = dict()  # stream -> 'SUBSCRIBE' / 'UNSUBSCRIBE' not sent yet.
+        self.last_send = 0.0
+        self.open = False
+        self._manager = manager
+        self.ws = None
+        self._start()
+
+    def _start(self):
+        t = threading.Thread(target=self._run, name=f'websocket-{self.number}')
+        t.daemon = True
+        t.start()
+
+    def send(self, payload: str):
+        self.ws.send(payload)
+
+    def _run(self):
+        self.ws = websocket.WebSocketApp(self._manager.base_wss, on_open=self._on_open, on_error=self._on_error,
+                                         on_close=self._on_close, on_message=self._manager.on_message)
+        while True:
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                logger.error('Lost connection to Websocket %d: %s', self.number, e)
+                self.ws.close()
+            self.open = False
+            time.sleep(2.0)
+
+    def _on_open(self, ws=None):
+        # Fresh connection: nothing is live, so everything this connection carries is (re)subscribed.
+        with self._manager.lock:
+            self.live.clear()
+            self.pending = {stream: 'SUBSCRIBE' for stream in self.streams}
+            self.open = True
+        logger.info('Websocket %d open, %d streams to subscribe.', self.number, len(self.streams))
+
+    def _on_error(self, ws, msg: str):
+        logger.error("Websocket %d error on %s: %s", self.number, self._manager.base_wss, msg)
+
+    def _on_close(self, ws=None, *args):
+        self.open = False
+        logger.warning("Websocket %d on %s closed.", self.number, self._manager.base_wss)
+
+
+class SubscriptionManager:
+    # Reference-counted market stream subscriptions. Watchlist rows and active strategies acquire the streams
+    # they need and release them when done, so only streams someone uses are subscribed.
+    # - Changes are queued and sent in batched SUBSCRIBE/UNSUBSCRIBE messages by a flusher thread, within the
+    #   per-connection message rate.
+    # - Streams are spread over as many connections as the per-connection stream cap requires.
+    # - After a reconnect, each connection resubscribes everything it carries.
+    # connection_factory(manager, number) opens a connection; the default runs each on its own thread.
+    def __init__(self, base_wss: str, on_message: typing.Callable,
+                 max_streams: int = MAX_STREAMS_PER_CONNECTION,
+                 max_messages_per_second: float = MAX_MESSAGES_PER_SECOND,
+                 max_streams_per_message: int = MAX_STREAMS_PER_MESSAGE,
+                 connection_factory: typing.Callable[..., WebsocketConnection] = WebsocketConnection):
+        self.base_wss = base_wss
+        self.on_message = on_message
+        self._connection_factory = connection_factory
+        self._max_streams = max_streams
+        self._send_interval = 1 / max_messages_per_second
+        self._batch_size = max_streams_per_message
+
+        self.lock = threading.Lock()
+        self._refcounts: typing.Dict[str, int] = dict()
+        self._connections: typing.List[WebsocketConnection] = []
+        self._stream_connection: typing.Dict[str, WebsocketConnection] = dict()
+        self._ws_id = 1
+        self._wake = threading.Event()
+
+        t = threading.Thread(target=self._flush_loop, name='subscription-flusher')
+        t.daemon = True
+        t.start()
+
+    @staticmethod
+    def stream_name(symbol: str, channel: str) -> str:
+        return symbol.lower() + '@' + channel
+
+    def acquire(self, symbol: str, channel: str):
+        stream = self.stream_name(symbol, channel)
+        with self.lock:
+            self._refcounts[stream] = self._refcounts.get(stream, 0) + 1
+            if self._refcounts[stream] > 1:
+                return
+
+            connection = next((conn for conn in self._connections if len(conn.streams) < self._max_streams), None)
+            if connection is None:
+                connection = self._connection_factory(self, len(self._connections))
+                self._connections.append(connection)
+            connection.streams.add(stream)
+            self._stream_connection[stream] = connection
+
+            if stream in connection.live:
+                connection.pending.pop(stream, None)
+            else:
+                connection.pending[stream] = 'SUBSCRIBE'
+        startup.mark('first_subscription')
+        self._wake.set()
+
+    def release(self, symbol: str, channel: str):
+        stream = self.stream_name(symbol, channel)
+        with self.lock:
+            if stream not in self._refcounts:
+                return
+            self._refcounts[stream] -= 1
+            if self._refcounts[stream] > 0:
+                return
+
+            del self._refcounts[stream]
+            connection = self._stream_connection.pop(stream)
+            connection.streams.discard(stream)
+            if stream in connection.live:
+                connection.pending[stream] = 'UNSUBSCRIBE'
+            else:
+                connection.pending.pop(stream, None)
+        self._wake.set()
+
+    def subscribed(self) -> typing.Dict[str, int]:
+        with self.lock:
+            return dict(self._refcounts)
+
+    def _flush_loop(self):
+        # Wakes on every change, and at least once per send interval to drain what the rate limit held back.
+        while True:
+            self._wake.wait(self._send_interval)
+            self._wake.clear()
+            now = time.monotonic()
+            for connection in list(self._connections):
+                if connection.open and connection.pending and now - connection.last_send >= self._send_interval:
+                    self._flush(connection)
+                    connection.last_send = now
+
+    def _flush(self, connection: WebsocketConnection):
+        # One message per call: the oldest queued method, up to the batch size.
+        with self.lock:
+            if not connection.pending:
+                return
+            method = next(iter(connection.pending.values()))
+            streams = [stream for stream, op in connection.pending.items() if op == method][:self._batch_size]
+            for stream in streams:
+                del connection.pending[stream]
+                if method == 'SUBSCRIBE':
+                    connection.live.add(stream)
+                else:
+                    connection.live.discard(stream)
+            request_id = self._ws_id
+            self._ws_id += 1
+
+        data = {'method': method, 'params': streams, 'id': request_id}
+        try:
+            connection.send(json.dumps(data))
+        except Exception as e:
+            logger.error('Error while sending %s for %d streams on websocket %d: %s', method, len(streams),
+                         connection.number, e)
+            with self.lock:
+                for stream in streams:
+                    if method == 'SUBSCRIBE':
+                        connection.live.discard(stream)
+                    else:
+                        connection.live.add(stream)
+                    connection.pending.setdefault(stream, method)
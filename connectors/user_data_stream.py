@@ -0,0 +1,118 @@
+import logging
+import time
+
+import websocket
+import json
+import threading
+import typing
+
+logger = logging.getLogger()
+
+# Binance closes a listenKey 60 minutes after the last keepalive.
+KEEPALIVE_INTERVAL = 30 * 60
+
+
+class BinanceUserDataStream:
+    # Private account websocket (listenKey). Dispatches events such as ACCOUNT_UPDATE and ORDER_TRADE_UPDATE
+    # to the handlers registered for them. Runs its own websocket thread, plus a housekeeping thread that keeps
+    # the listenKey alive and runs the periodic tasks registered with add_periodic_task.
+    def __init__(self, client, base_wss: str, period: float = 60):
+        self._client = client
+        # base_wss is the market stream endpoint ending in /ws; user streams live at /ws/<listenKey>.
+        self._base_wss = base_wss.rstrip('/')
+        self._period = period
+        self._listen_key = None
+        self._ws = None
+
+        self._handlers: typing.Dict[str, typing.List[typing.Callable]] = dict()
+        self._open_handlers: typing.List[typing.Callable] = []
+        self._periodic_tasks: typing.List[typing.Callable] = []
+
+        self.connected = False
+        self._opened_once = False
+
+    def add_handler(self, event_type: str, callback: typing.Callable[[typing.Dict], None]):
+        self._handlers.setdefault(event_type, []).append(callback)
+
+    def add_open_handler(self, callback: typing.Callable[[bool], None]):
+        # Called with reconnect=True on every connection after the first one.
+        self._open_handlers.append(callback)
+
+    def add_periodic_task(self, callback: typing.Callable[[], None]):
+        self._periodic_tasks.append(callback)
+
+    def start(self):
+        for target in [self._run_websocket, self._housekeeping]:
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+
+    def _new_listen_key(self) -> typing.Optional[str]:
+        response = self._client._make_request('POST', '/fapi/v1/listenKey', dict())
+        if response is None:
+            return None
+        return response['listenKey']
+
+    def _run_websocket(self):
+        while True:
+            self._listen_key = self._new_listen_key()
+            if self._listen_key is None:
+                logger.error('Could not get a listenKey for the user data stream.')
+                time.sleep(5.0)
+                continue
+
+            self._ws = websocket.WebSocketApp(self._base_wss + '/' + self._listen_key,
+                                              on_open=self._on_open,
+                                              on_error=self._on_error, on_close=self._on_close,
+                                              on_message=self._on_message)
+            try:
+                self._ws.run_forever()
+            except Exception as e:
+                logger.error('Lost connection to user data stream: %s', e)
+                self._ws.close()
+            self.connected = False
+            time.sleep(2.0)
+
+    def _housekeeping(self):
+        last_keepalive = time.monotonic()
+        while True:
+            time.sleep(self._period)
+            if self._listen_key is not None and time.monotonic() - last_keepalive >= KEEPALIVE_INTERVAL:
+                self._client._make_request('PUT', '/fapi/v1/listenKey', dict())
+                last_keepalive = time.monotonic()
+            for task in self._periodic_tasks:
+                try:
+                    task()
+                except Exception as e:
+                    logger.error('Error in user data stream periodic task: %s', e)
+
+    def _on_open(self, ws):
+        # Noted here rather than after run_forever returns, by which time _on_close has reset connected.
+        reconnect = self._opened_once
+        self._opened_once = True
+        self.connected = True
+        logger.info('User data stream %s.', 'reconnected' if reconnect else 'connected')
+        for callback in self._open_handlers:
+            callback(reconnect)
+
+    def _on_error(self, ws, msg: str):
+        logger.error('User data stream error: %s', msg)
+
+    def _on_close(self, ws, *args):
+        self.connected = False
+        logger.warning('User data stream closed.')
+
+    def _on_message(self, ws, msg: str):
+        data = json.loads(msg)
+        event_type = data.get('e')
+
+        if event_type == 'listenKeyExpired':
+            logger.warning('User data stream listenKey expired, reconnecting.')
+            ws.close()
+            return
+
+        for callback in self._handlers.get(event_type, []):
+            try:
+                callback(data)
+            except Exception as e:
+                logger.error('Error while handling %s event: %s', event_type, e)
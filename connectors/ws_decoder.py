@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import typing
+
+logger = logging.getLogger()
+
+try:
+    import orjson
+    _fast_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _fast_loads = None
+
+_EVENT_KEY = '"e":"'
+
+
+def sniff_event(msg: str) -> typing.Optional[str]:
+    # Binance stream payloads start with {"e":"<event type>",... so the type can be read without parsing.
+    # Returns None for anything else (subscription acks, errors), which should be fully decoded.
+    start = msg.find(_EVENT_KEY, 0, 16)
+    if start < 0:
+        return None
+    start += len(_EVENT_KEY)
+    return msg[start:msg.find('"', start)]
+
+
+def _string_field(msg: str, key: str) -> str:
+    start = msg.index(key) + len(key)
+    return msg[start:msg.index('"', start)]
+
+
+class MessageDecoder:
+    # Decodes websocket frames for the client. The event type is sniffed first, so frames for streams
+    # nobody consumes are counted and dropped unparsed. Frames are decoded with orjson when it is installed,
+    # or json otherwise. bookTicker frames only yield (symbol, bid, ask). With the json backend those three
+    # fields are sliced out of the string, which is about twice as fast as json.loads. orjson beats both.
+    def __init__(self, consumed: typing.Iterable[str] = ('bookTicker', 'aggTrade'), backend: str = 'auto'):
+        self.consumed = set(consumed)
+        if backend == 'json' or (backend == 'auto' and _fast_loads is None):
+            self.backend = 'json'
+            self._loads = json.loads
+            self.book_ticker = self._sliced_book_ticker
+        elif _fast_loads is not None:
+            self.backend = 'orjson'
+            self._loads = _fast_loads
+            self.book_ticker = self._decoded_book_ticker
+        else:
+            raise ValueError(f"JSON backend {backend} is not available.")
+        self.skipped = 0
+
+    def loads(self, msg: str) -> typing.Dict:
+        return self._loads(msg)
+
+    def wants(self, event_type: str) -> bool:
+        if event_type in self.consumed:
+            return True
+        self.skipped += 1
+        return False
+
+    def _sliced_book_ticker(self, msg: str) -> typing.Tuple[str, float, float]:
+        return _string_field(msg, '"s":"'), float(_string_field(msg, '"b":"')), float(_string_field(msg, '"a":"'))
+
+    def _decoded_book_ticker(self, msg: str) -> typing.Tuple[str, float, float]:
+        data = self._loads(msg)
+        return data['s'], float(data['b']), float(data['a'])
+
+
+class FeedRecorder:
+    # Appends raw frames, one per line, for replay with the benchmark below. Set client.feed_recorder to use it.
+    def __init__(self, path: str):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, msg: str):
+        with self._lock:
+            self._file.write(msg.replace('\n', '') + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+if __name__ == '__main__':
+    # Replay benchmark: python connectors/ws_decoder.py [recorded_feed.txt]
+    # Without a file, a synthetic feed of 90% bookTicker, 5% aggTrade and 5% unconsumed markPriceUpdate is used.
+    import random
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            feed = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        rng = random.Random(0)
+        feed = []
+        for i in range(200000):
+            roll = rng.random()
+            symbol = rng.choice(['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'XRPUSDT'])
+            price = f"{rng.uniform(1, 30000):.2f}"
+            if roll < 0.9:
+                feed.append(json.dumps({'e': 'bookTicker', 'u': i, 's': symbol, 'b': price, 'B': '31.21',
+                                        'a': price, 'A': '40.66', 'T': 1600000000000 + i, 'E': 1600000000000 + i},
+                                       separators=(',', ':')))
+            elif roll < 0.95:
+                feed.append(json.dumps({'e': 'aggTrade', 'E': 1600000000000 + i, 's': symbol, 'a': i, 'p': price,
+                                        'q': '0.010', 'f': i, 'l': i, 'T': 1600000000000 + i, 'm': True},
+                                       separators=(',', ':')))
+            else:
+                feed.append(json.dumps({'e': 'markPriceUpdate', 'E': 1600000000000 + i, 's': symbol, 'p': price,
+                                        'i': price, 'P': price, 'r': '0.0001', 'T': 1600000000000 + i},
+                                       separators=(',', ':')))
+
+    def baseline(msg: str):
+        # What BinanceFuturesClient._on_message did before: full json.loads of every frame.
+        data = json.loads(msg)
+        if "e" in data:
+            if data['e'] == 'bookTicker':
+                return data['s'], float(data['b']), float(data['a'])
+            elif data['e'] == 'aggTrade':
+                return data['s'], float(data['p']), float(data['q'])
+
+    def decoder_path(decoder: MessageDecoder):
+        def handle(msg: str):
+            event_type = sniff_event(msg)
+            data = None
+            if event_type is None:
+                data = decoder.loads(msg)
+                event_type = data.get('e') if isinstance(data, dict) else None
+                if event_type is None:
+                    return None
+            if not decoder.wants(event_type):
+                return None
+            if event_type == 'bookTicker' and data is None:
+                return decoder.book_ticker(msg)
+            if data is None:
+                data = decoder.loads(msg)
+            if event_type == 'bookTicker':
+                return data['s'], float(data['b']), float(data['a'])
+            if event_type == 'aggTrade':
+                return data['s'], float(data['p']), float(data['q'])
+        return handle
+
+    paths = {'json.loads (old)': baseline, 'decoder (json)': decoder_path(MessageDecoder(backend='json'))}
+    if orjson is not None:
+        paths['decoder (orjson)'] = decoder_path(MessageDecoder(backend='orjson'))
+
+    print(f"{len(feed)} messages")
+    for name, handle in paths.items():
+        wall, cpu = time.perf_counter(), time.process_time()
+        for message in feed:
+            handle(message)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        print(f"{name:>18}: {len(feed) / wall:>10,.0f} msg/s  {cpu / len(feed) * 1e6:6.2f} us CPU/msg")
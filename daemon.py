@@ -0,0 +1,202 @@
+import startup  # First, so the startup profile covers the other imports.
+
+import json
+import logging
+import signal
+import socketserver
+import sys
+import threading
+import time
+import typing
+
+import binance_keys  # This is binance_keys.py, that defines APIKEY, APISECRET, etc.
+import instrumentation
+import log_pipeline
+from connectors.binance_futures import BinanceFuturesClient
+from strategies import STRATEGY_CLASSES, STRATEGY_PARAMS, Strategy
+
+logger = logging.getLogger()
+startup.mark('imports')
+
+# Headless runner: python daemon.py strategies.json
+# Runs the same strategy classes as the UI without importing tkinter. Example config:
+# {
+#     "control_port": 8765,
+#     "strategies": [
+#         {"id": 1, "type": "Technical", "contract": "BTCUSDT", "timeframe": "15m", "balance_pct": 5,
+#          "take_profit": 2, "stop_loss": 1,
+#          "params": {"ema_fast": 12, "ema_slow": 26, "ema_signal": 9, "rsi_length": 14}},
+#         {"id": 2, "type": "Breakout", "contract": "ETHUSDT", "timeframe": "5m", "balance_pct": 5,
+#          "take_profit": 1, "stop_loss": 1, "params": {"min_volume": 500}}
+#     ]
+# }
+# The control socket listens on 127.0.0.1 and answers one command per line with one line of JSON:
+#   status  strategies, open positions, dispatcher and rate limit metrics
+#   latency p50/p99/max of the tick-to-order spans (LATENCY_SPANS = True in binance_keys.py)
+#   stop    deactivate all strategies and exit
+# Strategies only place orders with PLACE_ORDERS = True in binance_keys.py.
+# e.g. echo status | nc 127.0.0.1 8765
+
+DEFAULT_CONTROL_PORT = 8765
+
+
+def load_config(path: str) -> typing.Dict:
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    ids = set()
+    for definition in config.get('strategies', []):
+        for key in ['id', 'type', 'contract', 'timeframe', 'balance_pct', 'take_profit', 'stop_loss']:
+            if key not in definition:
+                raise ValueError(f"Strategy {definition.get('id', '?')} is missing '{key}'.")
+        if definition['id'] in ids:
+            raise ValueError(f"Duplicate strategy id {definition['id']}.")
+        ids.add(definition['id'])
+        if definition['type'] not in STRATEGY_CLASSES:
+            raise ValueError(f"Unknown strategy type {definition['type']}, expected one of {list(STRATEGY_CLASSES)}.")
+
+        params = definition.get('params', dict())
+        for code_name, name, data_type in STRATEGY_PARAMS[definition['type']]:
+            if code_name not in params:
+                raise ValueError(f"Strategy {definition['id']} is missing '{code_name}' ({name}).")
+            params[code_name] = data_type(params[code_name])
+        definition['params'] = params
+    return config
+
+
+class TradingDaemon:
+    def __init__(self, client: BinanceFuturesClient, config: typing.Dict):
+        self.client = client
+        self.config = config
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._log_index = 0
+        self._server: typing.Optional[socketserver.ThreadingTCPServer] = None
+
+    def start_strategies(self):
+        for definition in self.config.get('strategies', []):
+            try:
+                self._start_strategy(definition)
+            except Exception as e:
+                logger.error('Could not start strategy %s: %s', definition['id'], e)
+
+    def _start_strategy(self, definition: typing.Dict):
+        # Same steps as StrategyEditor._toggle_strategy.
+        contract = self.client.contracts.get(definition['contract'])
+        if contract is None:
+            raise ValueError(f"unknown contract {definition['contract']}")
+
+        strategy = STRATEGY_CLASSES[definition['type']](self.client, contract, 'Binance', definition['timeframe'],
+                                                         float(definition['balance_pct']),
+                                                         float(definition['take_profit']),
+                                                         float(definition['stop_loss']), definition['params'])
+        candles = self.client.backfill.get_candles(contract, definition['timeframe'])
+        if len(candles) == 0:
+            raise ValueError(f"no {contract.symbol} candles")
+        strategy.load_candles(candles)
+
+        self.client.add_strategy(definition['id'], strategy)
+        logger.info('Activated %s strategy %s on %s %s.', definition['type'], definition['id'], contract.symbol,
+                    definition['timeframe'])
+
+    def status(self) -> typing.Dict:
+        strategies = []
+        for strategy_id, strategy in list(self.client.strategies.items()):
+            strategies.append(self._strategy_status(strategy_id, strategy))
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'strategies': strategies,
+            'dispatcher': self.client.dispatcher.metrics(),
+            'signal_batches': self.client.signal_batcher.metrics(),
+            'rate_limits': self.client.rate_limiter.metrics(),
+            'logs_dropped': log_pipeline.dropped(),
+        }
+
+    @staticmethod
+    def _strategy_status(strategy_id, strategy: Strategy) -> typing.Dict:
+        position = strategy.open_position and strategy.trades[-1]
+        return {
+            'id': strategy_id,
+            'type': type(strategy).__name__,
+            'contract': strategy.contract.symbol,
+            'timeframe': strategy.timeframe,
+            'candles': len(strategy.candles),
+            'last_candle': int(strategy.candles.last_timestamp) if len(strategy.candles) else None,
+            'open_position': {'side': position.side, 'entry_price': position.entry_price,
+                              'quantity': position.quantity} if position else None,
+            'closed_trades': sum(1 for trade in strategy.trades if trade.status == 'closed'),
+            'pnl': sum(trade.pnl for trade in strategy.trades if trade.status == 'closed'),
+        }
+
+    def serve_control(self, port: int):
+        daemon = self
+
+        class ControlHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    command = line.decode('utf-8', 'replace').strip().lower()
+                    if command == 'status':
+                        reply = daemon.status()
+                    elif command == 'latency':
+                        reply = {'enabled': instrumentation.enabled, 'spans': instrumentation.snapshot()}
+                    elif command == 'stop':
+                        reply = {'stopping': True}
+                        daemon.stop()
+                    else:
+                        reply = {'error': f"unknown command '{command}'", 'commands': ['status', 'latency', 'stop']}
+                    self.wfile.write(json.dumps(reply, default=str).encode('utf-8') + b'\n')
+                    if command == 'stop':
+                        return
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', port), ControlHandler)
+        self._server.daemon_threads = True
+        t = threading.Thread(target=self._server.serve_forever, name='control-socket')
+        t.daemon = True
+        t.start()
+        logger.info('Control socket on 127.0.0.1:%d', port)
+
+    def run(self):
+        # Without a UI, client logs are written to the log instead of the logging panel.
+        while not self._stop.wait(1.0):
+            new_logs, self._log_index = self.client.logs.read(self._log_index)
+            for log in new_logs:
+                logger.info(log)
+
+        for strategy_id in list(self.client.strategies):
+            self.client.remove_strategy(strategy_id)
+        if self._server is not None:
+            self._server.shutdown()
+        logger.info('Daemon stopped.')
+
+    def stop(self, *args):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    log_pipeline.start('daemon.log', logging.INFO)
+
+    if len(sys.argv) != 2:
+        raise SystemExit('Usage: python daemon.py strategies.json')
+    daemon_config = load_config(sys.argv[1])
+
+    APIKEY = binance_keys.SANDBOX_APIKEY if binance_keys.SANDBOX_ON else binance_keys.ACTUAL_APIKEY
+    APISECRET = binance_keys.SANDBOX_APISECRET if binance_keys.SANDBOX_ON else binance_keys.ACTUAL_APISECRET
+    if getattr(binance_keys, 'LATENCY_SPANS', False):
+        instrumentation.enable()
+        instrumentation.start_dump(getattr(binance_keys, 'LATENCY_DUMP_S', 60), 'latency_spans.json')
+    if getattr(binance_keys, 'ASYNC_CLIENT', False):
+        from connectors.binance_futures_async import AsyncBinanceFuturesClient
+        binance_client = AsyncBinanceFuturesClient(APIKEY, APISECRET, binance_keys.SANDBOX_ON)
+    else:
+        binance_client = BinanceFuturesClient(APIKEY, APISECRET, binance_keys.SANDBOX_ON)
+
+    trading_daemon = TradingDaemon(binance_client, daemon_config)
+    signal.signal(signal.SIGINT, trading_daemon.stop)
+    signal.signal(signal.SIGTERM, trading_daemon.stop)
+    trading_daemon.serve_control(daemon_config.get('control_port', DEFAULT_CONTROL_PORT))
+    trading_daemon.start_strategies()
+    logger.info('Daemon running %d strategies.', len(binance_client.strategies))
+    startup.mark('ready')
+    trading_daemon.run()
+    log_pipeline.stop()
@@ -0,0 +1,387 @@
+import asyncio
+import collections
+import json
+import logging
+import math
+import random
+import statistics
+import time
+import typing
+
+from aiohttp import web, WSMsgType
+
+from strategies import timeframe_equiv
+from connectors.rate_limiter import endpoint_weight
+
+logger = logging.getLogger()
+
+# Local stand-in for the Binance futures REST API and websockets, for load and latency tests:
+#   python exchange_simulator.py [--port 8080] [--symbols 50] [--rate 10] [--trade-rate 50]
+# Point binance_keys at it (sandbox = 'http://127.0.0.1:8080', sandboxWebsocket = 'ws://127.0.0.1:8080/ws')
+# and start main.py or daemon.py as usual, with PLACE_ORDERS = True for orders. Signatures are not checked.
+#
+# Each subscribed bookTicker stream gets --rate events per second and each aggTrade stream --trade-rate.
+# The server measures:
+#   - tick to order: time from the last aggTrade sent for a symbol to the order for that symbol arriving.
+#     This includes websocket delivery both ways, parsing, signal checks and the order request.
+#   - achieved rate: events actually sent per second. When the bot can't keep up, the socket buffers fill and
+#     sends block, so this drops below the target. The highest target it still meets is the sustainable rate.
+# GET /stats returns both as JSON; they are also logged every --report seconds.
+
+KLINE_LIMIT = 1500
+
+
+class SimulatedMarket:
+    def __init__(self, symbol_count: int, seed: int = 0):
+        rng = random.Random(seed)
+        self.symbols = ['BTCUSDT', 'ETHUSDT'] + [f'SIM{i}USDT' for i in range(max(0, symbol_count - 2))]
+        self.prices = {symbol: rng.uniform(1, 50000) for symbol in self.symbols}
+        self.precision = {symbol: max(0, 4 - int(math.log10(price))) for symbol, price in self.prices.items()}
+        self._rng = rng
+        self._trade_id = 0
+
+    def exchange_info(self) -> typing.Dict:
+        return {'timezone': 'UTC', 'serverTime': now_ms(), 'symbols': [
+            {'symbol': symbol, 'pair': symbol, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+             'baseAsset': symbol[:-4], 'quoteAsset': 'USDT', 'marginAsset': 'USDT',
+             'pricePrecision': self.precision[symbol], 'quantityPrecision': 3} for symbol in self.symbols]}
+
+    def step(self, symbol: str) -> float:
+        price = self.prices[symbol] * math.exp(self._rng.gauss(0, 0.0005))
+        self.prices[symbol] = price
+        return price
+
+    def quote(self, symbol: str) -> typing.Tuple[str, str]:
+        price = self.prices[symbol]
+        spread = price * 0.0001
+        return self._format(symbol, price - spread / 2), self._format(symbol, price + spread / 2)
+
+    def book_ticker(self, symbol: str) -> typing.Dict:
+        bid, ask = self.quote(symbol)
+        timestamp = now_ms()
+        return {'e': 'bookTicker', 'u': timestamp, 's': symbol, 'b': bid, 'B': '10.000', 'a': ask, 'A': '10.000',
+                'T': timestamp, 'E': timestamp}
+
+    def agg_trade(self, symbol: str) -> typing.Dict:
+        self._trade_id += 1
+        price = self.step(symbol)
+        timestamp = now_ms()
+        return {'e': 'aggTrade', 'E': timestamp, 's': symbol, 'a': self._trade_id, 'p': self._format(symbol, price),
+                'q': f"{self._rng.uniform(0.001, 2):.3f}", 'f': self._trade_id, 'l': self._trade_id, 'T': timestamp,
+                'm': self._rng.random() < 0.5}
+
+    def klines(self, symbol: str, interval: str, start: typing.Optional[int], end: typing.Optional[int],
+               limit: int) -> typing.List[typing.List]:
+        # Deterministic per (symbol, open time), so repeated backfills agree with the cache.
+        interval_ms = timeframe_equiv(interval)
+        limit = min(limit, KLINE_LIMIT)
+        current_open = now_ms() // interval_ms * interval_ms
+        if end is None:
+            end = current_open
+        if start is None:
+            start = end - (limit - 1) * interval_ms
+        first = -(-start // interval_ms) * interval_ms
+
+        candles = []
+        for open_time in range(first, min(end, current_open) + 1, interval_ms):
+            rng = random.Random(f'{symbol}{open_time}')
+            base = self.prices[symbol] * (1 + 0.02 * math.sin(open_time / interval_ms / 50))
+            open_price, close_price = base * (1 + rng.gauss(0, 0.002)), base * (1 + rng.gauss(0, 0.002))
+            high = max(open_price, close_price) * (1 + abs(rng.gauss(0, 0.001)))
+            low = min(open_price, close_price) * (1 - abs(rng.gauss(0, 0.001)))
+            candles.append([open_time, self._format(symbol, open_price), self._format(symbol, high),
+                            self._format(symbol, low), self._format(symbol, close_price),
+                            f'{rng.uniform(1, 1000):.3f}', open_time + interval_ms - 1])
+            if len(candles) == limit:
+                break
+        return candles
+
+    def _format(self, symbol: str, price: float) -> str:
+        return f'{price:.{self.precision[symbol]}f}'
+
+
+class ExchangeSimulator:
+    def __init__(self, market: SimulatedMarket, rate: float = 10, trade_rate: float = 50, balance: float = 10000,
+                 fee_pct: float = 0.04):
+        self.market = market
+        self.rate = rate
+        self.trade_rate = trade_rate
+        self.wallet_balance = balance
+        self.fee_pct = fee_pct
+
+        self.orders: typing.Dict[int, typing.Dict] = dict()
+        self.positions: typing.Dict[str, float] = dict()
+        self._order_id = 0
+        self._user_sockets: typing.List[web.WebSocketResponse] = []
+
+        # Rate limit headers: fixed one-minute and ten-second windows, like the exchange.
+        self._window = (0, 0)
+        self._weight = 0
+        self._orders_10s = 0
+        self._orders_1m = 0
+
+        self._last_trade_sent: typing.Dict[str, float] = dict()
+        self.tick_to_order_ms: typing.Deque[float] = collections.deque(maxlen=100000)
+        self.sent = 0
+        self._sent_at_report = 0
+        self._report_time = time.perf_counter()
+        self.achieved_rate = 0.0
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._rate_limit_headers])
+        app.router.add_get('/fapi/v1/exchangeInfo', self._exchange_info)
+        app.router.add_get('/fapi/v1/klines', self._klines)
+        app.router.add_get('/fapi/v1/ticker/bookTicker', self._book_ticker)
+        app.router.add_get('/fapi/v1/account', self._account)
+        app.router.add_get('/fapi/v2/positionRisk', self._position_risk)
+        app.router.add_route('*', '/fapi/v1/order', self._order)
+        app.router.add_get('/fapi/v1/openOrders', self._open_orders)
+        app.router.add_route('*', '/fapi/v1/listenKey', self._listen_key)
+        app.router.add_get('/ws', self._market_stream)
+        app.router.add_get('/ws/{listen_key}', self._user_stream)
+        app.router.add_get('/stats', self._stats)
+        return app
+
+    @web.middleware
+    async def _rate_limit_headers(self, request: web.Request, handler):
+        minute, ten_seconds = int(time.time() // 60), int(time.time() // 10)
+        if minute != self._window[0]:
+            self._weight, self._orders_1m = 0, 0
+        if ten_seconds != self._window[1]:
+            self._orders_10s = 0
+        self._window = (minute, ten_seconds)
+
+        self._weight += endpoint_weight(request.method, request.path, dict(request.query))
+        if request.path == '/fapi/v1/order' and request.method in ('POST', 'DELETE'):
+            self._orders_10s += 1
+            self._orders_1m += 1
+
+        response = await handler(request)
+        if not isinstance(response, web.WebSocketResponse):
+            response.headers['X-MBX-USED-WEIGHT-1M'] = str(self._weight)
+            response.headers['X-MBX-ORDER-COUNT-10S'] = str(self._orders_10s)
+            response.headers['X-MBX-ORDER-COUNT-1M'] = str(self._orders_1m)
+        return response
+
+    async def _exchange_info(self, request: web.Request) -> web.Response:
+        return web.json_response(self.market.exchange_info())
+
+    async def _klines(self, request: web.Request) -> web.Response:
+        query = request.query
+        if query.get('symbol') not in self.market.prices:
+            return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+        start = int(query['startTime']) if 'startTime' in query else None
+        end = int(query['endTime']) if 'endTime' in query else None
+        return web.json_response(self.market.klines(query['symbol'], query.get('interval', '1m'), start, end,
+                                                    int(query.get('limit', 500))))
+
+    async def _book_ticker(self, request: web.Request) -> web.Response:
+        symbol = request.query.get('symbol')
+        if symbol not in self.market.prices:
+            return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+        bid, ask = self.market.quote(symbol)
+        return web.json_response({'symbol': symbol, 'bidPrice': bid, 'bidQty': '10.000', 'askPrice': ask,
+                                  'askQty': '10.000', 'time': now_ms()})
+
+    async def _account(self, request: web.Request) -> web.Response:
+        balance = f'{self.wallet_balance:.8f}'
+        return web.json_response({'assets': [{'asset': 'USDT', 'walletBalance': balance, 'unrealizedProfit': '0',
+                                              'marginBalance': balance, 'maintMargin': '0', 'initialMargin': '0'}]})
+
+    async def _position_risk(self, request: web.Request) -> web.Response:
+        return web.json_response([{'symbol': symbol, 'positionAmt': f'{amount:.8f}', 'positionSide': 'BOTH'}
+                                  for symbol, amount in self.positions.items()])
+
+    async def _order(self, request: web.Request) -> web.Response:
+        query = request.query
+        if request.method == 'POST':
+            if query.get('reduceOnly') == 'true':
+                position = self.positions.get(query['symbol'], 0.0)
+                if position == 0 or (position > 0) == (query['side'] == 'BUY'):
+                    return web.json_response({'code': -2022, 'msg': 'ReduceOnly Order is rejected.'}, status=400)
+            return web.json_response(await self._new_order(query))
+
+        order = self.orders.get(int(query.get('orderId', 0)))
+        if order is None:
+            return web.json_response({'code': -2013, 'msg': 'Order does not exist.'}, status=400)
+        if request.method == 'DELETE' and order['status'] == 'NEW':
+            self._update_order(order, 'CANCELED', 'CANCELED')
+        return web.json_response(order)
+
+    async def _new_order(self, query) -> typing.Dict:
+        symbol = query['symbol']
+        if symbol in self._last_trade_sent:
+            self.tick_to_order_ms.append((time.perf_counter() - self._last_trade_sent[symbol]) * 1000)
+
+        quantity = query['quantity']
+        if query.get('reduceOnly') == 'true':
+            # Never more than closes the position.
+            quantity = str(min(float(quantity), abs(self.positions.get(symbol, 0.0))))
+
+        self._order_id += 1
+        order = {'orderId': self._order_id, 'symbol': symbol, 'status': 'NEW',
+                 'clientOrderId': f'sim{self._order_id}', 'price': query.get('price', '0'), 'avgPrice': '0',
+                 'origQty': quantity, 'executedQty': '0',
+                 'side': query['side'], 'type': query['type'], 'timeInForce': query.get('timeInForce', 'GTC'),
+                 'updateTime': now_ms()}
+        self.orders[order['orderId']] = order
+        self._update_order(order, 'NEW', 'NEW')
+
+        response = dict(order)
+        if order['type'] == 'MARKET':
+            bid, ask = self.market.quote(symbol)
+            fill_price = float(ask if order['side'] == 'BUY' else bid)
+            quantity = float(order['origQty'])
+            self.positions[symbol] = round(self.positions.get(symbol, 0.0) +
+                                           (quantity if order['side'] == 'BUY' else -quantity), 8)
+            self.wallet_balance -= fill_price * float(order['origQty']) * self.fee_pct / 100
+            order['avgPrice'] = str(fill_price)
+            order['executedQty'] = order['origQty']
+            self._update_order(order, 'FILLED', 'TRADE')
+            self._send_user_event({'e': 'ACCOUNT_UPDATE', 'E': now_ms(), 'T': now_ms(),
+                                   'a': {'m': 'ORDER', 'B': [{'a': 'USDT', 'wb': f'{self.wallet_balance:.8f}',
+                                                              'cw': f'{self.wallet_balance:.8f}', 'bc': '0'}],
+                                         'P': []}})
+        # Like the exchange, the response describes the order as accepted; fills arrive on the user stream.
+        return response
+
+    async def _open_orders(self, request: web.Request) -> web.Response:
+        symbol = request.query.get('symbol')
+        return web.json_response([order for order in self.orders.values()
+                                  if order['status'] == 'NEW' and symbol in (None, order['symbol'])])
+
+    async def _listen_key(self, request: web.Request) -> web.Response:
+        return web.json_response({'listenKey': 'simulated-listen-key'} if request.method == 'POST' else {})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def _update_order(self, order: typing.Dict, status: str, execution: str):
+        order['status'] = status
+        order['updateTime'] = now_ms()
+        self._send_user_event({'e': 'ORDER_TRADE_UPDATE', 'E': order['updateTime'], 'T': order['updateTime'], 'o': {
+            's': order['symbol'], 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'],
+            'f': order['timeInForce'], 'q': order['origQty'], 'p': order['price'], 'ap': order['avgPrice'], 'sp': '0',
+            'x': execution, 'X': status, 'i': order['orderId'],
+            'l': order['executedQty'] if execution == 'TRADE' else '0', 'z': order['executedQty'],
+            'L': order['avgPrice'], 'T': order['updateTime'], 'n': '0', 'N': 'USDT',
+            'rp': '0'}})
+
+    def _send_user_event(self, event: typing.Dict):
+        payload = json.dumps(event)
+        for ws in list(self._user_sockets):
+            if not ws.closed:
+                asyncio.ensure_future(ws.send_str(payload))
+
+    async def _user_stream(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._user_sockets.append(ws)
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self._user_sockets.remove(ws)
+        return ws
+
+    async def _market_stream(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        streams: typing.Set[str] = set()
+        sender = asyncio.ensure_future(self._stream_events(ws, streams))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                request_data = json.loads(msg.data)
+                for stream in request_data.get('params', []):
+                    symbol = stream.split('@')[0].upper()
+                    if symbol not in self.market.prices:
+                        continue
+                    if request_data.get('method') == 'SUBSCRIBE':
+                        streams.add(stream)
+                    elif request_data.get('method') == 'UNSUBSCRIBE':
+                        streams.discard(stream)
+                await ws.send_str(json.dumps({'result': None, 'id': request_data.get('id')}))
+        finally:
+            sender.cancel()
+        return ws
+
+    async def _stream_events(self, ws: web.WebSocketResponse, streams: typing.Set[str]):
+        # Events are released in 10 ms batches, each stream accumulating rate * elapsed events.
+        due: typing.Dict[str, float] = dict()
+        last = time.perf_counter()
+        while not ws.closed:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            for stream in list(streams):
+                symbol, channel = stream.split('@')
+                symbol = symbol.upper()
+                rate = self.trade_rate if channel == 'aggTrade' else self.rate
+                due[stream] = due.get(stream, 0.0) + rate * elapsed
+                while due[stream] >= 1:
+                    due[stream] -= 1
+                    if channel == 'aggTrade':
+                        event = self.market.agg_trade(symbol)
+                    elif channel == 'bookTicker':
+                        event = self.market.book_ticker(symbol)
+                    else:
+                        break
+                    await ws.send_str(json.dumps(event, separators=(',', ':')))
+                    if channel == 'aggTrade':
+                        self._last_trade_sent[symbol] = time.perf_counter()
+                    self.sent += 1
+
+    def stats(self) -> typing.Dict:
+        now = time.perf_counter()
+        if now - self._report_time > 0:
+            self.achieved_rate = (self.sent - self._sent_at_report) / (now - self._report_time)
+        self._sent_at_report, self._report_time = self.sent, now
+
+        latencies = sorted(self.tick_to_order_ms)
+        return {
+            'events_sent': self.sent,
+            'events_per_sec': round(self.achieved_rate, 1),
+            'orders': self._order_id,
+            'tick_to_order_ms': {
+                'count': len(latencies),
+                'p50': round(statistics.median(latencies), 2) if latencies else None,
+                'p99': round(latencies[int(len(latencies) * 0.99)], 2) if latencies else None,
+                'max': round(latencies[-1], 2) if latencies else None,
+            },
+        }
+
+    async def report(self, period: float):
+        while True:
+            await asyncio.sleep(period)
+            logger.info('Simulator: %s', self.stats())
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=10, help='bookTicker events per second per stream')
+    parser.add_argument('--trade-rate', type=float, default=50, help='aggTrade events per second per stream')
+    parser.add_argument('--balance', type=float, default=10000)
+    parser.add_argument('--report', type=float, default=10, help='seconds between stats lines')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s :: %(message)s")
+    simulator = ExchangeSimulator(SimulatedMarket(args.symbols, args.seed), args.rate, args.trade_rate, args.balance)
+
+    async def start_background(app: web.Application):
+        app['report'] = asyncio.ensure_future(simulator.report(args.report))
+
+    simulator_app = simulator.app()
+    simulator_app.on_startup.append(start_background)
+    logger.info('Exchange simulator on http://127.0.0.1:%d, websocket ws://127.0.0.1:%d/ws', args.port, args.port)
+    web.run_app(simulator_app, host='127.0.0.1', port=args.port, print=None, access_log=None)
@@ -0,0 +1,228 @@
+import math
+import typing
+
+import numpy as np
+
+# Streaming versions of the pandas indicators used by TechnicalStrategy.
+# Every update is O(1) and the running sums follow pandas' ewm(adjust=True).mean(), so results match
+# the old full-history pandas calculation to within 1e-12 of the close price for the MACD line and signal,
+# and exactly for the 2-decimal RSI (barring a float landing on a rounding boundary, worst case 0.01).
+
+
+def span_to_alpha(span: float) -> float:
+    return 2 / (span + 1)
+
+
+def com_to_alpha(com: float) -> float:
+    return 1 / (1 + com)
+
+
+class Ema:
+    def __init__(self, alpha: float, min_periods: int = 0):
+        self._decay = 1 - alpha
+        self._min_periods = max(min_periods, 1)
+        self._num = 0.0
+        self._den = 0.0
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, x: float) -> float:
+        # adjust=True weights: sum((1-a)^i * x[t-i]) / sum((1-a)^i), kept as two running sums.
+        self._num = x + self._decay * self._num
+        self._den = 1.0 + self._decay * self._den
+        self.count += 1
+        if self.count >= self._min_periods:
+            self.value = self._num / self._den
+        return self.value
+
+
+class Macd:
+    def __init__(self, fast: int, slow: int, signal: int):
+        self._fast = Ema(span_to_alpha(fast))
+        self._slow = Ema(span_to_alpha(slow))
+        self._signal = Ema(span_to_alpha(signal))
+        self.macd_line = math.nan
+        self.macd_signal = math.nan
+
+    def update(self, close: float) -> typing.Tuple[float, float]:
+        self.macd_line = self._fast.update(close) - self._slow.update(close)
+        self.macd_signal = self._signal.update(self.macd_line)
+        return self.macd_line, self.macd_signal
+
+
+class Rsi:
+    def __init__(self, length: int):
+        self._avg_gain = Ema(com_to_alpha(length - 1), min_periods=length)
+        self._avg_loss = Ema(com_to_alpha(length - 1), min_periods=length)
+        self._prev_close = None
+        self.value = math.nan
+
+    def update(self, close: float) -> float:
+        if self._prev_close is None:
+            # The first close has no delta, like closes.diff().dropna().
+            self._prev_close = close
+            return self.value
+
+        delta = close - self._prev_close
+        self._prev_close = close
+
+        avg_gain = self._avg_gain.update(delta if delta > 0 else 0.0)
+        avg_loss = self._avg_loss.update(-delta if delta < 0 else 0.0)
+
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            self.value = math.nan
+        elif avg_loss == 0:
+            self.value = 100.0 if avg_gain > 0 else math.nan
+        else:
+            self.value = round(100 - (100 / (1 + avg_gain / avg_loss)), 2)
+        return self.value
+
+
+# Whole-series versions for backtests and parameter sweeps. Time runs along axis 0; a 2-D input computes one
+# series per column in the same pass.
+
+def ema_array(values: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    # pandas ewm(adjust=True).mean(). Inside a block, the running sum is d^k * cumsum(x_i * d^-i), which is
+    # pure NumPy. Blocks are short enough that d^-i cannot overflow, and each block starts from the previous
+    # block's last sum.
+    values = np.asarray(values, dtype=np.float64)
+    decay = 1 - alpha
+    out = np.empty_like(values)
+    if decay <= 0:
+        out[:] = values
+    else:
+        block = max(1, int(300 / -np.log(decay))) if decay < 1 else len(values)
+        carry = np.zeros(values.shape[1:])
+        for start in range(0, len(values), block):
+            chunk = values[start:start + block]
+            powers = decay ** np.arange(len(chunk), dtype=np.float64)
+            shape = (-1,) + (1,) * (values.ndim - 1)
+            sums = np.cumsum(chunk / powers.reshape(shape), axis=0) * powers.reshape(shape)
+            sums += carry * (decay * powers).reshape(shape)
+            out[start:start + block] = sums
+            carry = sums[-1]
+        weights = (1 - decay ** np.arange(1, len(values) + 1, dtype=np.float64)) / alpha
+        out /= weights.reshape((-1,) + (1,) * (values.ndim - 1))
+    if min_periods > 1:
+        out[:min_periods - 1] = np.nan
+    return out
+
+
+def macd_array(closes: np.ndarray, fast: int, slow: int, signal: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    macd_line = ema_array(closes, span_to_alpha(fast)) - ema_array(closes, span_to_alpha(slow))
+    return macd_line, ema_array(macd_line, span_to_alpha(signal))
+
+
+def rsi_array(closes: np.ndarray, length: int) -> np.ndarray:
+    # Value i is the RSI after close i; index 0 has no delta and is NaN, like Rsi.update.
+    closes = np.asarray(closes, dtype=np.float64)
+    delta = np.diff(closes, axis=0)
+    avg_gain = ema_array(np.clip(delta, 0, None), com_to_alpha(length - 1), min_periods=length)
+    avg_loss = ema_array(np.clip(-delta, 0, None), com_to_alpha(length - 1), min_periods=length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.round(100 - (100 / (1 + avg_gain / avg_loss)), 2)
+    rsi = np.where((avg_loss == 0) & (avg_gain == 0), np.nan, rsi)
+    return np.concatenate([np.full((1,) + closes.shape[1:], np.nan), rsi], axis=0)
+
+
+# Batched streaming versions: one row of state per series, for many series that share parameters. Each update
+# advances only the given rows, by one value each, with the same arithmetic as the scalar classes.
+
+class EmaBatch:
+    def __init__(self, alpha: float, min_periods: int = 0, size: int = 16):
+        self._decay = 1 - alpha
+        self._min_periods = max(min_periods, 1)
+        self._num = np.zeros(size)
+        self._den = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.value = np.full(size, np.nan)
+
+    def resize(self, size: int):
+        old = len(self._num)
+        self._num = np.concatenate([self._num, np.zeros(size - old)])
+        self._den = np.concatenate([self._den, np.zeros(size - old)])
+        self.count = np.concatenate([self.count, np.zeros(size - old, dtype=np.int64)])
+        self.value = np.concatenate([self.value, np.full(size - old, np.nan)])
+
+    def set_row(self, row: int, ema: Ema):
+        self._num[row] = ema._num
+        self._den[row] = ema._den
+        self.count[row] = ema.count
+        self.value[row] = ema.value
+
+    def update(self, rows: np.ndarray, x: np.ndarray) -> np.ndarray:
+        num = x + self._decay * self._num[rows]
+        den = 1.0 + self._decay * self._den[rows]
+        count = self.count[rows] + 1
+        value = np.where(count >= self._min_periods, num / den, self.value[rows])
+        self._num[rows] = num
+        self._den[rows] = den
+        self.count[rows] = count
+        self.value[rows] = value
+        return value
+
+
+class MacdBatch:
+    def __init__(self, fast: int, slow: int, signal: int, size: int = 16):
+        self._fast = EmaBatch(span_to_alpha(fast), size=size)
+        self._slow = EmaBatch(span_to_alpha(slow), size=size)
+        self._signal = EmaBatch(span_to_alpha(signal), size=size)
+        self.macd_line = np.full(size, np.nan)
+
+    @property
+    def macd_signal(self) -> np.ndarray:
+        return self._signal.value
+
+    def resize(self, size: int):
+        for ema in [self._fast, self._slow, self._signal]:
+            ema.resize(size)
+        self.macd_line = np.concatenate([self.macd_line, np.full(size - len(self.macd_line), np.nan)])
+
+    def set_row(self, row: int, macd: Macd):
+        self._fast.set_row(row, macd._fast)
+        self._slow.set_row(row, macd._slow)
+        self._signal.set_row(row, macd._signal)
+        self.macd_line[row] = macd.macd_line
+
+    def update(self, rows: np.ndarray, closes: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        macd_line = self._fast.update(rows, closes) - self._slow.update(rows, closes)
+        self.macd_line[rows] = macd_line
+        return macd_line, self._signal.update(rows, macd_line)
+
+
+class RsiBatch:
+    def __init__(self, length: int, size: int = 16):
+        self._avg_gain = EmaBatch(com_to_alpha(length - 1), min_periods=length, size=size)
+        self._avg_loss = EmaBatch(com_to_alpha(length - 1), min_periods=length, size=size)
+        self._prev_close = np.full(size, np.nan)
+        self.value = np.full(size, np.nan)
+
+    def resize(self, size: int):
+        self._avg_gain.resize(size)
+        self._avg_loss.resize(size)
+        self._prev_close = np.concatenate([self._prev_close, np.full(size - len(self._prev_close), np.nan)])
+        self.value = np.concatenate([self.value, np.full(size - len(self.value), np.nan)])
+
+    def set_row(self, row: int, rsi: Rsi):
+        self._avg_gain.set_row(row, rsi._avg_gain)
+        self._avg_loss.set_row(row, rsi._avg_loss)
+        self._prev_close[row] = math.nan if rsi._prev_close is None else rsi._prev_close
+        self.value[row] = rsi.value
+
+    def update(self, rows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+        # Rows seeing their first close only store it, like Rsi.update.
+        all_rows = rows
+        prev = self._prev_close[rows]
+        self._prev_close[rows] = closes
+        started = ~np.isnan(prev)
+        rows, closes, prev = rows[started], closes[started], prev[started]
+
+        delta = closes - prev
+        avg_gain = self._avg_gain.update(rows, np.where(delta > 0, delta, 0.0))
+        avg_loss = self._avg_loss.update(rows, np.where(delta < 0, -delta, 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.round(100 - (100 / (1 + avg_gain / avg_loss)), 2)
+        value = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, np.nan), value)
+        value[np.isnan(avg_gain) | np.isnan(avg_loss)] = np.nan
+        self.value[rows] = value
+        return self.value[all_rows]
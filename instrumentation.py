@@ -0,0 +1,176 @@
+import json
+import logging
+import threading
+import time
+import typing
+
+import numpy as np
+
+logger = logging.getLogger()
+
+# Timing spans for the tick-to-order path. Call sites check `instrumentation.enabled` before taking a
+# timestamp, so a disabled build pays one attribute lookup per span:
+#
+#     if instrumentation.enabled:
+#         start = time.perf_counter_ns()
+#     ...
+#     if instrumentation.enabled:
+#         instrumentation.record('parse_trades', strategy.label, start)
+#
+# Each (span, key) pair feeds its own histogram. Keys are strategy labels, symbols or endpoints.
+
+enabled = False
+
+# Log-linear buckets: 8 per power of two, so any percentile is within 1/8 of the true value.
+_SUB_BUCKETS = 8
+_SUB_BITS = 3
+_BUCKETS = 65 * _SUB_BUCKETS
+
+# Samples a histogram holds before they are sorted into its buckets.
+_PENDING = 4096
+
+
+class Histogram:
+    # Recording only appends to pending; the samples are put in buckets PENDING at a time, in one numpy pass,
+    # or when the histogram is read. Appends aren't locked: concurrent writers to the same key can rarely lose
+    # a sample, which doesn't matter for percentiles and keeps the cost down.
+    __slots__ = ('counts', 'count', 'total', 'max', 'pending')
+
+    def __init__(self):
+        self.counts = np.zeros(_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.pending: typing.List[int] = []
+
+    def record(self, ns: int):
+        self.pending.append(ns)
+        if len(self.pending) >= _PENDING:
+            self.fold()
+
+    def fold(self):
+        with _fold_lock:
+            pending, self.pending = self.pending, []
+            if not pending:
+                return
+            ns = np.maximum(np.array(pending, dtype=np.int64), 0)
+            # frexp's exponent is the bit length, exactly, below 2 ** 53 ns.
+            bits = np.frexp(ns.astype(np.float64))[1]
+            shift = np.maximum(bits - _SUB_BITS - 1, 0)
+            index = np.where(bits > _SUB_BITS + 1, bits * _SUB_BUCKETS + ((ns >> shift) & (_SUB_BUCKETS - 1)), ns)
+            self.counts += np.bincount(index, minlength=_BUCKETS)
+            self.count += len(ns)
+            self.total += int(ns.sum())
+            self.max = max(self.max, int(ns.max()))
+
+    def percentile(self, fraction: float) -> int:
+        # Lower bound of the bucket holding the percentile, in ns.
+        self.fold()
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts.tolist()):
+            seen += count
+            if count and seen >= target:
+                if index < 2 * _SUB_BUCKETS:
+                    return index
+                bits, sub = divmod(index, _SUB_BUCKETS)
+                return (_SUB_BUCKETS + sub) << (bits - _SUB_BITS - 1)
+        return self.max
+
+    def summary(self) -> typing.Dict[str, float]:
+        self.fold()
+        return {'count': self.count, 'p50_us': self.percentile(0.5) / 1000, 'p99_us': self.percentile(0.99) / 1000,
+                'max_us': self.max / 1000, 'mean_us': round(self.total / self.count / 1000, 3) if self.count else 0}
+
+
+_histograms: typing.Dict[typing.Tuple[str, str], Histogram] = dict()
+_lock = threading.Lock()
+_fold_lock = threading.Lock()
+
+
+def enable(on: bool = True):
+    global enabled
+    enabled = on
+
+
+def record(span: str, key: str, start_ns: int):
+    elapsed = time.perf_counter_ns() - start_ns
+    histogram = _histograms.get((span, key))
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault((span, key), Histogram())
+    # Histogram.record, inline.
+    pending = histogram.pending
+    pending.append(elapsed)
+    if len(pending) >= _PENDING:
+        histogram.fold()
+
+
+def snapshot() -> typing.Dict[str, typing.Dict[str, typing.Dict[str, float]]]:
+    # {span: {key: {count, p50_us, p99_us, max_us, mean_us}}}
+    spans: typing.Dict[str, typing.Dict[str, typing.Dict[str, float]]] = dict()
+    for (span, key), histogram in sorted(list(_histograms.items())):
+        histogram.fold()
+        if histogram.count:
+            spans.setdefault(span, dict())[key] = histogram.summary()
+    return spans
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def format_table() -> str:
+    lines = [f"{'span':<16}{'key':<34}{'count':>9}{'p50 us':>10}{'p99 us':>10}{'max us':>11}"]
+    for span, keys in snapshot().items():
+        for key, summary in keys.items():
+            lines.append(f"{span:<16}{key[:33]:<34}{summary['count']:>9}{summary['p50_us']:>10.1f}"
+                         f"{summary['p99_us']:>10.1f}{summary['max_us']:>11.1f}")
+    return '\n'.join(lines)
+
+
+def start_dump(period: float = 60.0, path: typing.Optional[str] = None):
+    # Logs the table every period seconds and, with a path, rewrites it as JSON for other tools to pick up.
+    def dump():
+        while True:
+            time.sleep(period)
+            if not _histograms:
+                continue
+            logger.info('Latency spans:\n%s', format_table())
+            if path is not None:
+                try:
+                    with open(path, 'w', encoding='utf-8') as f:
+                        json.dump({'time': int(time.time()), 'spans': snapshot()}, f, indent=1)
+                except OSError as e:
+                    logger.error('Could not write latency spans to %s: %s', path, e)
+
+    t = threading.Thread(target=dump, name='span-dump')
+    t.daemon = True
+    t.start()
+
+
+if __name__ == '__main__':
+    # Per-span cost, enabled and disabled.
+    count = 1000000
+
+    def timed_loop() -> float:
+        start_loop = time.perf_counter()
+        for _ in range(count):
+            if enabled:
+                start = time.perf_counter_ns()
+            if enabled:
+                record('bench', 'BTCUSDT', start)
+        return (time.perf_counter() - start_loop) / count * 1e9
+
+    def bare_loop() -> float:
+        start_loop = time.perf_counter()
+        for _ in range(count):
+            pass
+        return (time.perf_counter() - start_loop) / count * 1e9
+
+    baseline = bare_loop()
+    print(f"disabled: {timed_loop() - baseline:6.0f} ns per span")
+    enable()
+    print(f"enabled:  {timed_loop() - baseline:6.0f} ns per span")
+    print(format_table())
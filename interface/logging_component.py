@@ -1,6 +1,7 @@
 import tkinter as tk
 from datetime import datetime
 from interface.styling import *
+from log_pipeline import UI_LOG_SIZE
 import logging
 
 logger = logging.getLogger()
@@ -18,4 +19,6 @@ class Logging(tk.Frame):
         # logger.debug('add_log -> '+message)
         self.logging_text.configure(state=tk.NORMAL)
         self.logging_text.insert("1.0", datetime.utcnow().strftime("%a %H:%M:%S :: ") + message + '\n')
+        # Newest first; keep the panel as long as the client's log buffer.
+        self.logging_text.delete(f"{UI_LOG_SIZE + 1}.0", tk.END)
         self.logging_text.configure(state=tk.DISABLED)
\ No newline at end of file
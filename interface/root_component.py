@@ -1,5 +1,8 @@
 import tkinter as tk
 import logging
+import time
+
+import journal
 from connectors.binance_futures import BinanceFuturesClient
 from connectors.coinbase import CoinBaseFuturesClient
 
@@ -10,11 +13,19 @@ from interface.trades_component import TradesWatch
 from interface.strategy_componenet import StrategyEditor
 logger = logging.getLogger()
 
+# Milliseconds between UI refreshes. Each refresh only touches rows whose price changed.
+UI_REFRESH_MS = 1500
+
 class Root(tk.Tk):
-    def __init__(self, binance_client: BinanceFuturesClient, coinbase_client: CoinBaseFuturesClient):
+    def __init__(self, binance_client: BinanceFuturesClient, coinbase_client: CoinBaseFuturesClient,
+                 refresh_ms: int = UI_REFRESH_MS):
         super().__init__()
         self.binance_client = binance_client
         self.coinbase_client = coinbase_client
+        self._refresh_ms = refresh_ms
+        self._price_version = 0
+        self._log_index = 0
+        self._journal_index = 0
         self.title("Trading Bot")
         self.configure(bg=BG_COLOUR)
 
@@ -24,7 +35,7 @@ class Root(tk.Tk):
         self._right_frame.pack(side=tk.LEFT)  # Yes, on the left.
 
         # The dict() here is a place holder. For adding another exchange.
-        self._watchlist_frame = Watchlist(self.binance_client.get_contracts(), dict(), self._left_frame, bg=BG_COLOUR)
+        self._watchlist_frame = Watchlist(self.binance_client, dict(), self._left_frame, bg=BG_COLOUR)
         self._watchlist_frame.pack(side=tk.TOP)
 
         self.logging_frame = Logging(self._left_frame, bg=BG_COLOUR)
@@ -40,52 +51,40 @@ class Root(tk.Tk):
         self._update_ui()
 
     def _update_ui(self):
-        # Update logs
-        for log in self.binance_client.logs:
-            if not log['displayed']:
-                # logger.debug('UI update')
-                self.logging_frame.add_log(log['log'])
-                log['displayed'] = True
-
-        # Update watchlist
-        try:
-            for key, value in self._watchlist_frame.body_widgets['symbol'].items():
-                symbol = self._watchlist_frame.body_widgets['symbol'][key].cget('text')
-                exchange = self._watchlist_frame.body_widgets['exchange'][key].cget('text')
-
-                if exchange == 'Binance':
-                    if symbol not in self.binance_client.contracts:
-                        continue
-
-                    if symbol not in self.binance_client.prices:
-                        self.binance_client.get_bid_ask(self.binance_client.contracts[symbol])
-                        continue
-
-                    precision = self.binance_client.contracts[symbol].price_decimals
-
-                    prices = self.binance_client.prices[symbol]
-
-                elif exchange == 'CoinBase':
-                    if symbol not in self.coinbase_client:
-                        continue
-
-                    if symbol not in self.coinbase_client.prices:
-                        self.coinbase_client.get_bid_ask(self.coinbase_client.contracts[symbol])
-                        continue
-
-                    precision = self.binance_client.contracts[symbol].price_decimals
-
-                    prices = self.binance_client[symbol]
-
-                else:
-                    continue
-
-                if prices['bid'] is not None:
-                    price_str = "{0:.{prec}f}".format(prices['bid'], prec=precision)
-                    self._watchlist_frame.body_widgets['bid_var'][key].set(price_str)
-                if prices['ask'] is not None:
-                    price_str = "{0:.{prec}f}".format(prices['ask'], prec=precision)
-                    self._watchlist_frame.body_widgets['ask_var'][key].set(price_str)
-        except RuntimeError as e:
-            logger.error('Runtime Error while updating watchlist.')
-        self.after(1500, self._update_ui)
+        # Update logs, starting after the last one shown.
+        new_logs, self._log_index = self.binance_client.logs.read(self._log_index)
+        for log in new_logs:
+            self.logging_frame.add_log(log)
+
+        # Update watchlist: only symbols whose price changed since the last refresh. Rows added in between are
+        # painted by the watchlist itself, and quotes missing from the stream are fetched off this thread.
+        changed, self._price_version = self.binance_client.prices.changed_since(self._price_version)
+        for symbol in changed:
+            if ('Binance', symbol) in self._watchlist_frame.rows_by_symbol:
+                bid, ask, _, _ = self.binance_client.prices.snapshot(symbol)
+                self._watchlist_frame.set_prices('Binance', symbol, bid, ask)
+
+        # Trades: positions opened and closed since the last refresh. The first refresh lists the positions still
+        # open and the most recent closed ones from the journal, rather than replaying all of it.
+        if self._journal_index == 0:
+            opened, closed, self._journal_index = self.binance_client.journal.positions()
+            for record in closed + opened:
+                self._add_trade(record)
+        records, self._journal_index = self.binance_client.journal.records(self._journal_index,
+                                                                           (journal.OPEN, journal.CLOSE))
+        for record in records:
+            if record.kind == journal.OPEN:
+                self._add_trade(record)
+            else:
+                self._trades_frame.update_trade(record.order_id, 'closed', f"{record.pnl:.2f}")
+
+        self.after(self._refresh_ms, self._update_ui)
+
+    def _add_trade(self, record: journal.JournalRecord):
+        # An OPEN record, or the CLOSE record of a position opened before the journal was read.
+        self._trades_frame.add_trade({
+            'time': time.strftime('%Y-%m-%d %H:%M', time.localtime(record.time / 1000)),
+            'symbol': record.symbol, 'exchange': 'Binance', 'strategy': record.strategy,
+            'side': 'long' if record.side == 1 else 'short', 'quantity': record.quantity,
+            'status': 'open' if record.kind == journal.OPEN else 'closed',
+            'pnl': '0.00' if record.kind == journal.OPEN else f"{record.pnl:.2f}", 'entry_id': record.order_id})
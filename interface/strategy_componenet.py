@@ -1,3 +1,4 @@
+import threading
 import tkinter as tk
 import typing
 
@@ -8,7 +9,7 @@ logger = logging.getLogger()
 
 from connectors.binance_futures import BinanceFuturesClient
 from connectors.coinbase import CoinBaseFuturesClient
-from strategies import TechnicalStrategy, BreakoutStrategy
+from strategies import STRATEGY_CLASSES, STRATEGY_PARAMS
 
 class StrategyEditor(tk.Frame):
     def __init__(self, root, binance: BinanceFuturesClient, coinbase: CoinBaseFuturesClient, *args, **kwargs):
@@ -17,14 +18,11 @@ class StrategyEditor(tk.Frame):
         self.root = root
         # self._exchanges = {'Binance': binance, 'Coinbase': coinbase}
         self._exchanges = {'Binance': binance}
-        self._all_contracts = []
+        self._all_contracts = [symbol + '_' + exchange.capitalize()
+                               for exchange, client in self._exchanges.items() for symbol in client.contracts]
 
         self._all_timeframes = ['1m', '5m', '15m', '1h', '4h', '1d', '5d']
 
-        for exchange, client in self._exchanges.items():
-            for symbol, contract in client.contracts.items():
-                self._all_contracts.append(symbol + '_' + exchange.capitalize())
-
         self._additional_parameters = dict()
         self._extra_input = dict()
 
@@ -44,7 +42,7 @@ class StrategyEditor(tk.Frame):
 
         self._base_params = [
             {'code_name': 'strategy_type', 'widget': tk.OptionMenu, 'data_type': str,
-             'values': ['Technical', 'Breakout'], 'width': 10},
+             'values': list(STRATEGY_CLASSES), 'width': 10},
             {'code_name': 'contract', 'widget': tk.OptionMenu, 'data_type': str,
              'values': self._all_contracts, 'width': 15},
             {'code_name': 'time_frame', 'widget': tk.OptionMenu, 'data_type': str,
@@ -61,15 +59,9 @@ class StrategyEditor(tk.Frame):
         ]
 
         self._extra_params = {
-            "Technical": [
-                {'code_name': 'ema_fast', 'name': 'MACD fast period', 'widget': tk.Entry, 'data_type': int},
-                {'code_name': 'ema_slow', 'name': 'MACD slow period', 'widget': tk.Entry, 'data_type': int},
-                {'code_name': 'ema_signal', 'name': 'MACD signal period', 'widget': tk.Entry, 'data_type': int},
-                {'code_name': 'rsi_length', 'name': 'RSI period', 'widget': tk.Entry, 'data_type': int},
-            ],
-            "Breakout": [
-                {'code_name': 'min_volume', 'name': 'Minimum volume', 'widget': tk.Entry, 'data_type': float},
-            ],
+            strategy_type: [{'code_name': code_name, 'name': name, 'widget': tk.Entry, 'data_type': data_type}
+                            for code_name, name, data_type in params]
+            for strategy_type, params in STRATEGY_PARAMS.items()
         }
         for position, header in enumerate(self._headers):
             h = tk.Label(self._table_frame, text=header, bg=BG_COLOUR, fg=FG_COLOUR1, font=BOLD_FONT)
@@ -203,31 +195,28 @@ class StrategyEditor(tk.Frame):
         contract = self._exchanges[exchange].contracts[symbol]
 
         if self.body_widgets['activation'][row].cget('text') == 'off':
-            if strategy_selected == "Technical":
-                new_strategy = TechnicalStrategy(self._exchanges['exchange'], contract, exchange, timeframe,
-                                                 balance_pct, take_profit, stop_loss, self._additional_parameters[row])
-            elif strategy_selected == "Breakout":
-                new_strategy = BreakoutStrategy(self._exchanges['exchange'], contract, exchange, timeframe,
-                                                balance_pct, take_profit, stop_loss, self._additional_parameters[row])
-            else:
-                return
-
-            new_strategy.candles = self._exchanges[exchange].get_historical_data(contract, timeframe)
+            new_strategy = STRATEGY_CLASSES[strategy_selected](self._exchanges[exchange], contract, exchange,
+                                                               timeframe, balance_pct, take_profit, stop_loss,
+                                                               self._additional_parameters[row])
 
-            if len(new_strategy.candles) == 0:
-                self.root.logging_frame.add_log(f"Error retrieving {contract.symbol} candles.")
-                return
-
-            self._exchanges[exchange].strategies[row] = new_strategy
-            # Deactivate params so they can't be changed.
+            # The backfill and add_strategy make REST requests, which can wait for rate limit budget, so they run
+            # off the Tk thread. The row is locked meanwhile, and _finish_activation checks back for the result.
             for param in self._base_params:
-                code_name = param['code_name']
-                if code_name != 'activation' and '_var' not in code_name:
-                    self.body_widgets[code_name][row].config(state=tk.DISABLED)
-            self.body_widgets['activation'][row].config(bg='darkgreen', text='on')
-            self.root.logging_frame.add_log(f'Activated {strategy_selected} strategy on {symbol}.')
+                self.body_widgets[param['code_name']][row].config(state=tk.DISABLED)
+            result = []
+
+            def activate():
+                candles = self._exchanges[exchange].backfill.get_candles(contract, timeframe)
+                if len(candles) > 0:
+                    new_strategy.load_candles(candles)
+                    self._exchanges[exchange].add_strategy(row, new_strategy)
+                result.append(len(candles) > 0)
+
+            t = threading.Thread(target=activate, daemon=True)
+            t.start()
+            self.after(100, self._finish_activation, row, t, result, strategy_selected, symbol)
         else:
-            del self._exchanges[exchange].strategies[row]
+            self._exchanges[exchange].remove_strategy(row)
             # Activate params.
             for param in self._base_params:
                 code_name = param['code_name']
@@ -236,6 +225,24 @@ class StrategyEditor(tk.Frame):
             self.body_widgets['activation'][row].config(bg='darkred', text='off')
             self.root.logging_frame.add_log(f'Deactivated {strategy_selected} strategy on {symbol}.')
 
+    def _finish_activation(self, row: int, t: threading.Thread, result: typing.List[bool], strategy_selected: str,
+                           symbol: str):
+        if t.is_alive():
+            self.after(100, self._finish_activation, row, t, result, strategy_selected, symbol)
+            return
+
+        activated = len(result) > 0 and result[0]
+        # Params stay deactivated while the strategy runs, so they can't be changed.
+        for param in self._base_params:
+            code_name = param['code_name']
+            if not activated or code_name == 'activation' or '_var' in code_name:
+                self.body_widgets[code_name][row].config(state=tk.NORMAL)
+        if activated:
+            self.body_widgets['activation'][row].config(bg='darkgreen', text='on')
+            self.root.logging_frame.add_log(f'Activated {strategy_selected} strategy on {symbol}.')
+        else:
+            self.root.logging_frame.add_log(f"Error retrieving {symbol} candles.")
+
     def _delete_row(self, b_index: int):
         logger.debug('Delete row: %s', b_index)
         # Run through the columns, forgetting cells and removing entries... and I'm all out of entries.
@@ -3,6 +3,9 @@ import typing
 
 from interface.styling import *
 
+# Rows kept in the table. Past that, the oldest closed trade is taken out for each one added.
+MAX_TRADE_ROWS = 200
+
 class TradesWatch(tk.Frame):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -23,16 +26,41 @@ class TradesWatch(tk.Frame):
             self.body_widgets[header] = dict()
 
         self._body_index = 1
+        # Entry order id -> closed, oldest row first.
+        self._rows: typing.Dict[int, bool] = dict()
 
     def add_trade(self, data: typing.Dict):
+        # Rows are keyed by the entry order id, so the same position can be updated when it closes.
         row = self._body_index
-        time_index = data['time']
-        for position, header in data:
-            self.body_widgets[header][time_index] = tk.Label(self._table_frame, text=data[header], bg=BG_COLOUR,
-                                                             fg=FG_COLOUR2, font=GLOBAL_FONT)
-            self.body_widgets[header][time_index].grid(row=row, column=position)
+        trade_index = data['entry_id']
+        if trade_index in self._rows:
+            self._remove_trade(trade_index)
+        elif len(self._rows) >= MAX_TRADE_ROWS:
+            self._remove_trade(next((index for index, closed in self._rows.items() if closed),
+                                    next(iter(self._rows))))
+        for position, header in enumerate(self._headers):
             if header in ['status', 'pnl']:
-                self.body_widgets[header + '_var'][time_index] = tk.StringVar()
-            print(data)
+                self.body_widgets[header + '_var'][trade_index] = tk.StringVar(value=data[header])
+                self.body_widgets[header][trade_index] = tk.Label(
+                    self._table_frame, textvariable=self.body_widgets[header + '_var'][trade_index], bg=BG_COLOUR,
+                    fg=FG_COLOUR2, font=GLOBAL_FONT)
+            else:
+                self.body_widgets[header][trade_index] = tk.Label(self._table_frame, text=data[header], bg=BG_COLOUR,
+                                                                  fg=FG_COLOUR2, font=GLOBAL_FONT)
+            self.body_widgets[header][trade_index].grid(row=row, column=position)
 
         self._body_index += 1
+        self._rows[trade_index] = data['status'] == 'closed'
+
+    def update_trade(self, trade_index: int, status: str, pnl: str):
+        if trade_index in self.body_widgets['status_var']:
+            self.body_widgets['status_var'][trade_index].set(status)
+            self.body_widgets['pnl_var'][trade_index].set(pnl)
+            self._rows[trade_index] = status == 'closed'
+
+    def _remove_trade(self, trade_index: int):
+        for header in self._headers:
+            self.body_widgets[header].pop(trade_index).destroy()
+            if header in ['status', 'pnl']:
+                del self.body_widgets[header + '_var'][trade_index]
+        del self._rows[trade_index]
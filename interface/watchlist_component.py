@@ -1,12 +1,18 @@
 import tkinter as tk
+import threading
+import logging
+import typing
 
 from interface.styling import *
 
+logger = logging.getLogger()
+
 class Watchlist(tk.Frame):
-    def __init__(self, binance_contracts, coinbase_contracts, *args, **kwargs):
+    def __init__(self, binance_client, coinbase_contracts, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.binance_symbols = list(binance_contracts.keys())
+        self._binance_client = binance_client
+        self.binance_symbols = list(binance_client.contracts.keys())
         self.coinbase_symbols = list(coinbase_contracts.keys())
         self._commands_frame = tk.Frame(self, bg = BG_COLOUR)
         self._commands_frame.pack(side=tk.TOP)
@@ -44,9 +50,44 @@ class Watchlist(tk.Frame):
             if header in ['bid', 'ask']:
                 self.body_widgets[header+'_var'] = dict()
 
+        # Per row: symbol, exchange, price format and the strings currently shown, so refreshes don't read
+        # widgets back or set unchanged values. rows_by_symbol maps (exchange, symbol) to its rows.
+        self.rows: typing.Dict[int, typing.Dict] = dict()
+        self.rows_by_symbol: typing.Dict[typing.Tuple[str, str], typing.Set[int]] = dict()
+
         self._body_index = 1
 
+    def set_prices(self, exchange: str, symbol: str, bid: float, ask: float):
+        for row in self.rows_by_symbol.get((exchange, symbol), ()):
+            info = self.rows[row]
+            if bid is not None:
+                bid_str = format(bid, info['price_format'])
+                if bid_str != info['bid']:
+                    info['bid'] = bid_str
+                    self.body_widgets['bid_var'][row].set(bid_str)
+            if ask is not None:
+                ask_str = format(ask, info['price_format'])
+                if ask_str != info['ask']:
+                    info['ask'] = ask_str
+                    self.body_widgets['ask_var'][row].set(ask_str)
+
+    def _fetch_first_quote(self, symbol: str):
+        # REST quote until the stream delivers one. Runs off the Tk thread; the price book version it bumps
+        # gets the row painted on the next refresh.
+        try:
+            self._binance_client.get_bid_ask(self._binance_client.contracts[symbol])
+        except Exception as e:
+            logger.error('Could not get a first quote for %s: %s', symbol, e)
+
     def _remove_symbol(self, row: int):
+        info = self.rows.pop(row)
+        symbol, exchange = info['symbol'], info['exchange']
+        self.rows_by_symbol[(exchange, symbol)].discard(row)
+        if not self.rows_by_symbol[(exchange, symbol)]:
+            del self.rows_by_symbol[(exchange, symbol)]
+        if exchange == 'Binance':
+            self._binance_client.unsubscribe_from_channel([self._binance_client.contracts[symbol]], 'bookTicker')
+
         for col in self._headers:
             self.body_widgets[col][row].grid_forget()
             del self.body_widgets[col][row]
@@ -66,6 +107,9 @@ class Watchlist(tk.Frame):
     def _add_symbol(self, symbol: str, exchange: str):
         b_index = self._body_index
 
+        if exchange == 'Binance':
+            self._binance_client.subscribe_to_channel([self._binance_client.contracts[symbol]], 'bookTicker')
+
         self.body_widgets['symbol'][b_index] = tk.Label(self._table_frame, text=symbol, bg=BG_COLOUR, fg=FG_COLOUR2,
                                                         font=GLOBAL_FONT)
         self.body_widgets['symbol'][b_index].grid(row=b_index, column=0)
@@ -89,5 +133,17 @@ class Watchlist(tk.Frame):
                                                          command=lambda: self._remove_symbol(b_index))
         self.body_widgets['remove'][b_index].grid(row=b_index, column=4)
 
+        precision = self._binance_client.contracts[symbol].price_decimals
+        self.rows[b_index] = {'symbol': symbol, 'exchange': exchange, 'price_format': f'.{precision}f',
+                              'bid': None, 'ask': None}
+        self.rows_by_symbol.setdefault((exchange, symbol), set()).add(b_index)
+
+        if exchange == 'Binance':
+            quote = self._binance_client.prices.get(symbol)
+            if quote is not None:
+                self.set_prices(exchange, symbol, quote['bid'], quote['ask'])
+            else:
+                threading.Thread(target=self._fetch_first_quote, args=(symbol,), daemon=True).start()
+
         self._body_index += 1
         return
@@ -0,0 +1,261 @@
+import collections
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+
+from models import *
+
+logger = logging.getLogger()
+
+# Append-only journal of signals, orders, fills and positions, so trades survive a restart.
+# Records are fixed-width and written straight into a memory-mapped file: an append is a struct.pack_into,
+# with no system call, so strategies write from the signal path. The file grows CHUNK_RECORDS at a time.
+JOURNAL_PATH = 'journal.bin'
+JOURNAL_TESTNET_PATH = 'journal_testnet.bin'
+CHUNK_RECORDS = 65536
+
+# Closed positions kept in memory for a UI to list at startup, most recent last.
+RECENT_CLOSED = 100
+
+SIGNAL = 1    # side, price = close at the signal
+ORDER = 2     # order_id, side, quantity, price = average price when known
+FILL = 3      # order_id, side, quantity = executed so far, price = average price
+OPEN = 4      # position opened: order_id = entry order, side, quantity, price = entry price
+CLOSE = 5     # position closed: order_id = entry order, side, quantity, price = exit price, pnl
+
+KIND_NAMES = {SIGNAL: 'signal', ORDER: 'order', FILL: 'fill', OPEN: 'open', CLOSE: 'close'}
+
+# kind, side, padding, time (ms), order id, price, quantity, pnl, symbol, strategy type, timeframe, padding.
+_RECORD = struct.Struct('<Bb6xqqddd20s20s4s4x')
+RECORD_SIZE = _RECORD.size
+
+
+class JournalRecord(typing.NamedTuple):
+    kind: int
+    side: int
+    time: int
+    order_id: int
+    price: float
+    quantity: float
+    pnl: float
+    symbol: str
+    strategy: str
+    timeframe: str
+
+
+def _unpack(buffer, offset: int) -> JournalRecord:
+    kind, side, ts, order_id, price, quantity, pnl, symbol, strategy, timeframe = _RECORD.unpack_from(buffer, offset)
+    return JournalRecord(kind, side, ts, order_id, price, quantity, pnl, symbol.rstrip(b'\0').decode(),
+                         strategy.rstrip(b'\0').decode(), timeframe.rstrip(b'\0').decode())
+
+
+def read_journal(path: str = JOURNAL_PATH) -> typing.Iterator[JournalRecord]:
+    # Offline reader. Unwritten slots at the end of the file have kind 0, which ends the journal.
+    with open(path, 'rb') as f:
+        data = f.read()
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        if data[offset] == 0:
+            return
+        yield _unpack(data, offset)
+
+
+class Journal:
+    # The kind byte of a record is written last, so a crash mid-write leaves a slot that reads as unwritten.
+    # Open positions are indexed by (strategy type, symbol, timeframe): a strategy added with the same three
+    # takes over one of them at startup, and its take profit and stop loss manage it from there.
+    def __init__(self, path: str = JOURNAL_PATH, chunk_records: int = CHUNK_RECORDS):
+        self.path = path
+        self._chunk = chunk_records * RECORD_SIZE
+        self._lock = threading.Lock()
+        # (strategy type, symbol, timeframe) -> entry order id -> OPEN record, for positions not closed yet.
+        self._positions: typing.Dict[typing.Tuple[str, str, str], typing.Dict[int, JournalRecord]] = dict()
+        # Entry order ids of open positions some running strategy holds.
+        self._claimed: typing.Set[int] = set()
+        self._closed: typing.Deque[JournalRecord] = collections.deque(maxlen=RECENT_CLOSED)
+
+        self._file = open(path, 'a+b')
+        try:
+            # Two processes appending to one mapped journal would write over each other's records.
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise RuntimeError(f"Journal {path} is in use by another process. Stop it, or run this one from "
+                               f"another directory.") from None
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self._chunk or size % RECORD_SIZE:
+            size = max(self._chunk, size - size % RECORD_SIZE + self._chunk)
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        self._count = 0
+        while self._count * RECORD_SIZE < size and self._map[self._count * RECORD_SIZE] != 0:
+            record = _unpack(self._map, self._count * RECORD_SIZE)
+            self._index_position(record)
+            self._count += 1
+        logger.info("Journal %s: %d records, %d open positions.", path, self._count,
+                    sum(len(positions) for positions in self._positions.values()))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def write(self, kind: int, symbol: str, strategy: str = '', timeframe: str = '', side: int = 0,
+              order_id: int = 0, price: float = 0.0, quantity: float = 0.0, pnl: float = 0.0,
+              ts: typing.Optional[int] = None):
+        if ts is None:
+            ts = int(time.time() * 1000)
+        with self._lock:
+            offset = self._count * RECORD_SIZE
+            if offset + RECORD_SIZE > len(self._map):
+                self._grow()
+            _RECORD.pack_into(self._map, offset, 0, side, ts, order_id or 0, price, quantity, pnl,
+                              symbol.encode()[:20], strategy.encode()[:20], timeframe.encode()[:4])
+            self._map[offset] = kind
+            self._count += 1
+            if kind in (OPEN, CLOSE):
+                self._index_position(_unpack(self._map, offset))
+                if kind == OPEN:
+                    self._claimed.add(order_id)
+                else:
+                    self._claimed.discard(order_id)
+
+    def _grow(self):
+        size = len(self._map) + self._chunk
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def _index_position(self, record: JournalRecord):
+        key = (record.strategy, record.symbol, record.timeframe)
+        if record.kind == OPEN:
+            self._positions.setdefault(key, dict())[record.order_id] = record
+        elif record.kind == CLOSE:
+            self._closed.append(record)
+            positions = self._positions.get(key, dict())
+            positions.pop(record.order_id, None)
+            if not positions:
+                self._positions.pop(key, None)
+
+    # Typed helpers for the places that journal.
+
+    def signal(self, strategy, side: int, price: float):
+        self.write(SIGNAL, strategy.contract.symbol, type(strategy).__name__, strategy.timeframe, side,
+                   price=price)
+
+    def order(self, order_status: OrderStatus):
+        self.write(ORDER, order_status.symbol or '', side=1 if order_status.side == 'BUY' else -1,
+                   order_id=order_status.order_id, price=order_status.avg_price, quantity=order_status.quantity)
+
+    def fill(self, order_status: OrderStatus):
+        self.write(FILL, order_status.symbol or '', side=1 if order_status.side == 'BUY' else -1,
+                   order_id=order_status.order_id, price=order_status.avg_price,
+                   quantity=order_status.executed_quantity)
+
+    def position_opened(self, strategy, trade: Trade):
+        self.write(OPEN, trade.contract.symbol, trade.strategy, strategy.timeframe, 1 if trade.side == 'long' else -1,
+                   trade.entry_id, trade.entry_price, trade.quantity, ts=trade.time)
+
+    def position_closed(self, strategy, trade: Trade, exit_price: float):
+        self.write(CLOSE, trade.contract.symbol, trade.strategy, strategy.timeframe,
+                   1 if trade.side == 'long' else -1, trade.entry_id, exit_price, trade.quantity, trade.pnl)
+
+    def records(self, start: int = 0, kinds: typing.Optional[typing.Collection[int]] = None
+                ) -> typing.Tuple[typing.List[JournalRecord], int]:
+        # (records from index start on, index for the next read), for readers that keep their own cursor (the UI).
+        # With kinds, records of other kinds are skipped on the kind byte, without unpacking them.
+        with self._lock:
+            return [_unpack(self._map, i * RECORD_SIZE) for i in range(start, self._count)
+                    if kinds is None or self._map[i * RECORD_SIZE] in kinds], self._count
+
+    def positions(self) -> typing.Tuple[typing.List[JournalRecord], typing.List[JournalRecord], int]:
+        # (OPEN records of open positions, the last RECENT_CLOSED CLOSE records, journal length), taken together
+        # so a reader can list them and follow on with records(length).
+        with self._lock:
+            opened = sorted((record for positions in self._positions.values() for record in positions.values()),
+                            key=lambda record: record.time)
+            return opened, list(self._closed), self._count
+
+    def open_positions(self) -> typing.List[JournalRecord]:
+        with self._lock:
+            return [record for positions in self._positions.values() for record in positions.values()]
+
+    def net_position(self, symbol: str) -> float:
+        # Signed sum of the journal's open positions on a symbol: what the exchange should hold, in one-way mode.
+        with self._lock:
+            return sum(record.side * record.quantity for positions in self._positions.values()
+                       for record in positions.values() if record.symbol == symbol)
+
+    def can_restore(self, strategy) -> bool:
+        # Whether restore would have a position to offer the strategy, so the caller only asks the exchange then.
+        if strategy.open_position:
+            return False
+        with self._lock:
+            return self._unclaimed(strategy) is not None
+
+    def _unclaimed(self, strategy) -> typing.Optional[JournalRecord]:
+        key = (type(strategy).__name__, strategy.contract.symbol, strategy.timeframe)
+        return next((record for record in self._positions.get(key, dict()).values()
+                     if record.order_id not in self._claimed), None)
+
+    def restore(self, strategy, exchange_position: float) -> bool:
+        # Hands a position left open by an earlier run to the strategy now trading the same thing, if the exchange
+        # still holds it. exchange_position is the symbol's signed position amount on the exchange; positions on
+        # the symbol already held by running strategies are taken out of it first. A journalled position the
+        # exchange doesn't hold was closed outside the bot: it is recorded as closed, with no pnl, and not restored.
+        if strategy.open_position:
+            return False
+        symbol = strategy.contract.symbol
+        while True:
+            with self._lock:
+                record = self._unclaimed(strategy)
+                if record is None:
+                    return False
+                held = sum(claimed.side * claimed.quantity for positions in self._positions.values()
+                           for claimed in positions.values()
+                           if claimed.symbol == symbol and claimed.order_id in self._claimed)
+                available = (exchange_position - held) * record.side
+                on_exchange = available >= record.quantity * (1 - 1e-6)
+                if on_exchange:
+                    self._claimed.add(record.order_id)
+            if on_exchange:
+                break
+            logger.warning("Journalled %s %s position of %s (quantity %s) is not on the exchange (position %s); "
+                           "recording it as closed.", 'long' if record.side == 1 else 'short', symbol,
+                           record.strategy, record.quantity, exchange_position)
+            self.write(CLOSE, symbol, record.strategy, record.timeframe, record.side, record.order_id,
+                       quantity=record.quantity)
+
+        strategy.trades.append(Trade({'time': record.time, 'contract': strategy.contract, 'strategy': record.strategy,
+                                      'side': 'long' if record.side == 1 else 'short', 'entry_price': record.price,
+                                      'status': 'open', 'pnl': 0.0, 'quantity': record.quantity,
+                                      'entry_id': record.order_id}))
+        strategy.open_position = True
+        logger.info("Restored open %s %s position of %s from the journal.", strategy.trades[-1].side,
+                    symbol, record.strategy)
+        return True
+
+    def release(self, strategy):
+        # The strategy was stopped: a position it still holds can be taken over by the next one started.
+        if strategy.open_position and strategy.trades:
+            with self._lock:
+                self._claimed.discard(strategy.trades[-1].entry_id)
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()  # Releases the lock.
+
+
+if __name__ == '__main__':
+    # python journal.py [path]: print the journal.
+    import sys
+
+    for entry in read_journal(sys.argv[1] if len(sys.argv) > 1 else JOURNAL_PATH):
+        print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.time / 1000)), KIND_NAMES[entry.kind],
+              entry.symbol, entry.strategy, entry.timeframe, entry.side, entry.order_id, entry.price,
+              entry.quantity, entry.pnl)
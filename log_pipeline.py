@@ -0,0 +1,220 @@
+import collections
+import itertools
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+# Logging off the trading threads. Records go onto a bounded queue and a background thread writes them to the
+# console and the log file, so a logger call on the websocket thread never waits for disk. When the writer
+# falls behind by LOG_QUEUE_SIZE records, new ones are dropped and counted rather than blocking.
+#
+#     log_pipeline.start('info.log', logging.DEBUG)
+#     ...
+#     log_pipeline.stop()  # Writes out what is still queued.
+LOG_QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s %(levelname)s :: %(message)s"
+
+# The same message, from the same logger and at the same level, is written at most REPEAT_LIMIT times per
+# REPEAT_WINDOW seconds. The next one written after that says how many were left out. Errors always pass.
+REPEAT_LIMIT = 5
+REPEAT_WINDOW = 60.0
+_REPEAT_KEYS = 4096
+
+# Messages kept for the UI logging panel.
+UI_LOG_SIZE = 500
+
+
+class RepeatFilter(logging.Filter):
+    def __init__(self, limit: int = REPEAT_LIMIT, window: float = REPEAT_WINDOW, max_level: int = logging.WARNING):
+        super().__init__()
+        self._limit = limit
+        self._window = window
+        self._max_level = max_level
+        # (logger name, level, message) -> [window start, records in the window, suppressed in the window]
+        self._seen: typing.Dict[typing.Tuple[str, int, str], typing.List] = dict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self._max_level:
+            return True
+        # The message is formatted here once; the queue handler would format it on this thread anyway.
+        message = record.getMessage()
+        record.msg = message
+        record.args = None
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is None:
+                if len(self._seen) >= _REPEAT_KEYS:
+                    self._expire(now)
+                self._seen[key] = [now, 1, 0]
+                return True
+            if now - seen[0] >= self._window:
+                suppressed = seen[2]
+                seen[:] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{message} ({suppressed} more like this in the last {self._window:.0f} s)"
+                return True
+            seen[1] += 1
+            if seen[1] <= self._limit:
+                return True
+            seen[2] += 1
+            return False
+
+    def _expire(self, now: float):
+        # Messages with a value in them (prices, ids) each get a key; forget the ones that stopped repeating.
+        for key in [key for key, seen in self._seen.items() if now - seen[0] >= self._window]:
+            del self._seen[key]
+        if len(self._seen) >= _REPEAT_KEYS:
+            self._seen.clear()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # RepeatFilter has usually formatted the message already, and this is the root logger's only handler,
+        # so the record goes on the queue as it is instead of as a formatted copy.
+        if record.args or record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': logger.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"Log queue full: dropped {self._unreported} records."}))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+class LogBuffer(logging.Handler):
+    # Bounded buffer of log messages for a UI to show. Messages are numbered from 0 in the order they were
+    # added; a reader keeps the number it has read up to and gets only what came after, so a refresh costs the
+    # same however long the bot has run. When the reader falls behind by more than size, the oldest are lost.
+    # As a logging handler (see attach), it collects formatted messages from the pipeline's writer thread.
+    def __init__(self, size: int = UI_LOG_SIZE, level: int = logging.INFO):
+        super().__init__(level)
+        self._messages: typing.Deque[str] = collections.deque(maxlen=size)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._next
+
+    def append(self, message: str):
+        with self._lock:
+            self._messages.append(message)
+            self._next += 1
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def read(self, cursor: int = 0) -> typing.Tuple[typing.List[str], int]:
+        # (messages after cursor still in the buffer, cursor for the next read)
+        with self._lock:
+            first = self._next - len(self._messages)
+            return list(itertools.islice(self._messages, max(cursor - first, 0), None)), self._next
+
+
+_handler: typing.Optional[_DroppingQueueHandler] = None
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+
+
+def start(path: typing.Optional[str] = None, level: int = logging.INFO, queue_size: int = LOG_QUEUE_SIZE,
+          repeat_limit: int = REPEAT_LIMIT, repeat_window: float = REPEAT_WINDOW):
+    # Replaces the root logger's handlers with the queue. The writer thread logs to stderr and, with a path,
+    # appends to that file.
+    global _handler, _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: typing.List[logging.Handler] = [logging.StreamHandler()]
+    if path is not None:
+        handlers.append(logging.FileHandler(path))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _handler = _DroppingQueueHandler(queue.Queue(queue_size))
+    _handler.addFilter(RepeatFilter(repeat_limit, repeat_window))
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def attach(handler: logging.Handler):
+    # Adds a handler, such as a client's LogBuffer, to the writer thread.
+    if _listener is None:
+        logger.addHandler(handler)
+    else:
+        _listener.handlers = _listener.handlers + (handler,)
+
+
+def dropped() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def stop():
+    # Waits for the writer to finish what is queued, then closes the handlers.
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logger.removeHandler(_handler)
+    _listener = None
+
+
+if __name__ == '__main__':
+    # Cost of a logger call on the calling thread, with the file written synchronously and through the queue.
+    import os
+    import tempfile
+
+    count = 20000
+    directory = tempfile.mkdtemp()
+
+    def timed_loop() -> typing.Tuple[float, float]:
+        # (mean, 99th percentile) in microseconds.
+        times = []
+        for i in range(count):
+            start_call = time.perf_counter()
+            logger.info("New candle for %s on %s.", f"SYM{i % 500}USDT", 'Binance')
+            times.append(time.perf_counter() - start_call)
+            if i % 50 == 0:
+                time.sleep(0.001)  # Trades arrive in bursts; give the writer a chance to catch up.
+        times.sort()
+        return sum(times) / count * 1e6, times[int(count * 0.99)] * 1e6
+
+    file_handler = logging.FileHandler(os.path.join(directory, 'sync.log'))
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(file_handler)
+    logger.setLevel(logging.INFO)
+    sync_us = timed_loop()
+    logger.removeHandler(file_handler)
+    file_handler.close()
+
+    start(os.path.join(directory, 'queued.log'), repeat_limit=count)
+    _listener.handlers = _listener.handlers[1:]  # Leave the console out of it.
+    queued_us = timed_loop()
+    stop()
+    print(f"synchronous file: {sync_us[0]:6.1f} us per call, p99 {sync_us[1]:6.1f} us")
+    print(f"queued:           {queued_us[0]:6.1f} us per call, p99 {queued_us[1]:6.1f} us, {dropped()} dropped")
@@ -1,26 +1,23 @@
+import startup  # First, so the startup profile covers the other imports.
 import logging
 import tkinter as tk
 from connectors.binance_futures import BinanceFuturesClient
+from connectors.binance_futures_async import AsyncBinanceFuturesClient
 import binance_keys  # This is binance_keys.py, that defines APIKEY, APISECRET, etc.
+import instrumentation
+import log_pipeline
 from connectors.coinbase import CoinBaseFuturesClient
 import coinbase_keys
-from interface.root_component import Root
+from interface.root_component import Root, UI_REFRESH_MS
 logger = logging.getLogger()
+startup.mark('imports')
 
 ######################
 # Set up logging
 ######################
 
-logger.setLevel(logging.DEBUG)
-stream_handler = logging.StreamHandler()
-formatter = logging.Formatter("%(asctime)s %(levelname)s :: %(message)s")
-stream_handler.setFormatter(formatter)
-stream_handler.setLevel(logging.DEBUG)
-file_handler = logging.FileHandler('info.log')
-file_handler.setFormatter(formatter)
-file_handler.setLevel(logging.DEBUG)
-logger.addHandler(stream_handler)
-logger.addHandler(file_handler)
+# Written by a background thread, so logging never blocks the websocket threads.
+log_pipeline.start('info.log', logging.DEBUG)
 
 ######################
 # Main loop
@@ -31,11 +28,21 @@ if __name__ == "__main__":
     APISECRET = binance_keys.SANDBOX_APISECRET if binance_keys.SANDBOX_ON else binance_keys.ACTUAL_APISECRET
 
     logger.debug('Program start')
-    binance_client = BinanceFuturesClient(APIKEY, APISECRET, binance_keys.SANDBOX_ON)
+    if getattr(binance_keys, 'LATENCY_SPANS', False):
+        instrumentation.enable()
+        instrumentation.start_dump(getattr(binance_keys, 'LATENCY_DUMP_S', 60), 'latency_spans.json')
+    if getattr(binance_keys, 'ASYNC_CLIENT', False):
+        binance_client = AsyncBinanceFuturesClient(APIKEY, APISECRET, binance_keys.SANDBOX_ON)
+    else:
+        binance_client = BinanceFuturesClient(APIKEY, APISECRET, binance_keys.SANDBOX_ON)
+    # Info and above also go to the logging panel.
+    log_pipeline.attach(binance_client.logs)
     coinbase_client = CoinBaseFuturesClient(APIKEY, APISECRET, 'dave', True)
     # logger.debug('Client started')
-    root = Root(binance_client, coinbase_client)
+    root = Root(binance_client, coinbase_client, getattr(binance_keys, 'UI_REFRESH_MS', UI_REFRESH_MS))
     # logger.debug('TK root set')
+    startup.mark('ready')
     root.mainloop()
     logger.debug('End program')
+    log_pipeline.stop()
     exit(0)
\ No newline at end of file
@@ -9,6 +9,14 @@ class Balance:
             self.wallet_balance = float(info['walletBalance'])
             self.unrealized_pnl = float(info['unrealizedProfit'])
 
+        # ACCOUNT_UPDATE balance entry from the user data stream. Only the wallet balances are sent.
+        elif exchange == 'Binance_stream':
+            self.initial_margin = None
+            self.maintenance_margin = None
+            self.margin_balance = None
+            self.wallet_balance = float(info['wb'])
+            self.unrealized_pnl = None
+
 
 class Candle:
     def __init__(self, data, timeframe, exchange):
@@ -22,11 +30,11 @@ class Candle:
 
         elif exchange == 'parse_trade':
             self.timestamp = data['ts']
-            self.open = float(data[1])
-            self.high = float(data[2])
-            self.low = float(data[3])
-            self.close = float(data[4])
-            self.volume = float(data[5])
+            self.open = float(data['open'])
+            self.high = float(data['high'])
+            self.low = float(data['low'])
+            self.close = float(data['close'])
+            self.volume = float(data['volume'])
 
 class Contract:
     def __init__(self, info, exchange):
@@ -40,7 +48,37 @@ class Contract:
             self.lot_size = 1 / pow(10, info['quantityPrecision'])
 
 class OrderStatus:
-    def __init__(self, data):
-        self.order_id = data['orderId']
-        self.status = data['status']
-        self.avg_price = float(data['avgPrice'])
+    def __init__(self, data, exchange='Binance'):
+        if exchange == 'Binance':
+            self.order_id = data['orderId']
+            self.status = data['status']
+            self.avg_price = float(data['avgPrice'])
+            self.symbol = data.get('symbol')
+            self.side = data.get('side')
+            self.quantity = float(data.get('origQty', 0))
+            self.executed_quantity = float(data.get('executedQty', 0))
+            self.update_time = data.get('updateTime', 0)
+
+        # ORDER_TRADE_UPDATE 'o' object from the user data stream.
+        elif exchange == 'Binance_stream':
+            self.order_id = data['i']
+            self.status = data['X']
+            self.avg_price = float(data['ap'])
+            self.symbol = data['s']
+            self.side = data['S']
+            self.quantity = float(data['q'])
+            self.executed_quantity = float(data['z'])
+            self.update_time = data['T']
+
+
+class Trade:
+    def __init__(self, trade_info):
+        self.time: int = trade_info['time']
+        self.contract: Contract = trade_info['contract']
+        self.strategy: str = trade_info['strategy']
+        self.side: str = trade_info['side']
+        self.entry_price: float = trade_info['entry_price']
+        self.status: str = trade_info['status']
+        self.pnl: float = trade_info['pnl']
+        self.quantity = trade_info['quantity']
+        self.entry_id = trade_info['entry_id']
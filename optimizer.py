@@ -0,0 +1,258 @@
+import itertools
+import logging
+import os
+import random
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from models import *
+from indicators import ema_array, rsi_array, span_to_alpha
+from strategies import technical_rule, breakout_rule
+
+logger = logging.getLogger()
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# Parameters StrategyEditor asks for, plus take profit and stop loss.
+DEFAULT_GRIDS = {
+    'Technical': {'ema_fast': [8, 12, 16], 'ema_slow': [21, 26, 34], 'ema_signal': [7, 9], 'rsi_length': [10, 14],
+                  'take_profit': [0.5, 1.0, 2.0], 'stop_loss': [0.5, 1.0, 2.0]},
+    'Breakout': {'min_volume': [10.0, 50.0, 100.0, 500.0], 'take_profit': [0.5, 1.0, 2.0],
+                 'stop_loss': [0.5, 1.0, 2.0]},
+}
+
+# Parameters that change the indicators. Combos that share them are sent to workers together, so the
+# indicator arrays are computed once per group.
+INDICATOR_PARAMS = {'Technical': ['ema_fast', 'ema_slow', 'ema_signal', 'rsi_length'], 'Breakout': ['min_volume']}
+
+# Worker process state, set by _attach.
+_shm: typing.Optional[SharedMemory] = None
+_columns: typing.Dict[str, np.ndarray] = dict()
+_indicators: typing.Dict[typing.Tuple, np.ndarray] = dict()
+
+
+def _attach(shm_name: str, length: int):
+    global _shm, _columns, _indicators
+    _shm = SharedMemory(name=shm_name)
+    data = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=_shm.buf)
+    data.flags.writeable = False
+    _columns = {name: data[i] for i, name in enumerate(COLUMNS)}
+    _indicators = dict()
+
+
+def _indicator(key: typing.Tuple, compute: typing.Callable[[], np.ndarray]) -> np.ndarray:
+    if key not in _indicators:
+        _indicators[key] = compute()
+    return _indicators[key]
+
+
+def _technical_entries(params: typing.Dict) -> typing.Tuple[np.ndarray, np.ndarray, int]:
+    # technical_rule on every closed candle. Live, a candle's signal is acted on at the first trade of the next
+    # candle, so the entry is that candle's open and its whole range comes after the entry.
+    closes = _columns['close']
+    ema_fast = _indicator(('ema', params['ema_fast']), lambda: ema_array(closes, span_to_alpha(params['ema_fast'])))
+    ema_slow = _indicator(('ema', params['ema_slow']), lambda: ema_array(closes, span_to_alpha(params['ema_slow'])))
+    macd_line = ema_fast - ema_slow
+    macd_signal = _indicator(('macd_signal', params['ema_fast'], params['ema_slow'], params['ema_signal']),
+                             lambda: ema_array(macd_line, span_to_alpha(params['ema_signal'])))
+    rsi = _indicator(('rsi', params['rsi_length']), lambda: rsi_array(closes, params['rsi_length']))
+
+    with np.errstate(invalid='ignore'):
+        long, short = technical_rule(rsi, macd_line, macd_signal)
+    signals = np.zeros(len(closes), dtype=np.int8)
+    signals[1:] = long[:-1].astype(np.int8) - short[:-1].astype(np.int8)
+    return signals, _columns['open'], 0
+
+
+def _breakout_entries(params: typing.Dict) -> typing.Tuple[np.ndarray, np.ndarray, int]:
+    # breakout_rule as live checks it, on every trade of the live candle: a candle over the minimum volume whose
+    # range crosses the previous candle's high or low is entered at that level, or at its open if it opened
+    # beyond it. Approximate: live needs the volume so far over the minimum at the moment of the crossing, and
+    # a candle crossing both sides is taken on the side nearer its open. How the rest of the entry candle moved
+    # after the entry is unknown, so exits are looked for from the next candle.
+    opens = _columns['open']
+    highs = _columns['high']
+    lows = _columns['low']
+    volume = _columns['volume']
+    long = np.zeros(len(opens), dtype=bool)
+    short = np.zeros(len(opens), dtype=bool)
+    long[1:] = breakout_rule(volume[1:], highs[1:], highs[:-1], lows[:-1], params['min_volume'])[0]
+    short[1:] = breakout_rule(volume[1:], lows[1:], highs[:-1], lows[:-1], params['min_volume'])[1]
+
+    long_price = opens.copy()
+    long_price[1:] = np.maximum(opens[1:], highs[:-1])
+    short_price = opens.copy()
+    short_price[1:] = np.minimum(opens[1:], lows[:-1])
+    both = long & short
+    long_first = long_price - opens <= opens - short_price
+    long &= ~both | long_first
+    short &= ~both | ~long_first
+    return long.astype(np.int8) - short.astype(np.int8), np.where(long, long_price, short_price), 1
+
+
+def _first_hit(start: int, side: int, take_price: float, stop_price: float) -> typing.Tuple[int, float]:
+    # First candle at or after start that touches the stop or the target. The stop wins ties. Scans in
+    # growing windows so short trades don't touch the whole series.
+    highs = _columns['high']
+    lows = _columns['low']
+    window = 64
+    while start < len(highs):
+        high = highs[start:start + window]
+        low = lows[start:start + window]
+        if side == 1:
+            stop_hit, take_hit = low <= stop_price, high >= take_price
+        else:
+            stop_hit, take_hit = high >= stop_price, low <= take_price
+        hit = stop_hit | take_hit
+        if hit.any():
+            i = int(np.argmax(hit))
+            return start + i, stop_price if stop_hit[i] else take_price
+        start += window
+        window *= 4
+    return len(highs) - 1, float(_columns['close'][-1])
+
+
+def _simulate(signals: np.ndarray, prices: np.ndarray, exit_offset: int, params: typing.Dict,
+              fee_pct: float) -> typing.Dict:
+    # One position at a time. signals and prices are the side and price of an entry in each candle; the exit is
+    # the first touch of take profit or stop loss from exit_offset candles after the entry. Returns are in
+    # percent of the position, after entry and exit fees.
+    entries = np.flatnonzero(signals)
+    returns = []
+    position = 0
+    while position < len(entries):
+        i = int(entries[position])
+        side = int(signals[i])
+        entry = float(prices[i])
+        take_price = entry * (1 + side * params['take_profit'] / 100)
+        stop_price = entry * (1 - side * params['stop_loss'] / 100)
+        j, exit_price = _first_hit(i + exit_offset, side, take_price, stop_price)
+        returns.append(side * (exit_price - entry) / entry * 100 - 2 * fee_pct)
+        position = int(np.searchsorted(entries, j, side='right'))
+
+    returns = np.array(returns)
+    equity = np.cumsum(returns)
+    drawdown = float(np.max(np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:] - equity)) \
+        if len(returns) else 0.0
+    return {'return_pct': float(equity[-1]) if len(returns) else 0.0, 'trades': len(returns),
+            'win_rate': float(np.mean(returns > 0)) if len(returns) else 0.0, 'max_drawdown_pct': drawdown}
+
+
+def _evaluate(task: typing.Tuple[str, typing.List[typing.Dict], float]) -> typing.List[typing.Dict]:
+    strategy_type, combos, fee_pct = task
+    results = []
+    for params in combos:
+        if strategy_type == 'Technical':
+            entries = _technical_entries(params)
+        else:
+            entries = _breakout_entries(params)
+        results.append({**params, **_simulate(*entries, params, fee_pct)})
+    return results
+
+
+def parameter_combos(grid: typing.Dict[str, typing.List], samples: typing.Optional[int] = None,
+                     seed: int = 0) -> typing.List[typing.Dict]:
+    # Full grid, or a random sample of it when samples is set.
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if samples is not None and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return combos
+
+
+def run_sweep(candles: typing.List[Candle], strategy_type: str, combos: typing.List[typing.Dict],
+              processes: typing.Optional[int] = None, fee_pct: float = 0.04) -> typing.List[typing.Dict]:
+    # Evaluates every combo on a process pool and returns results best return first. Candle columns are
+    # written once to shared memory; workers map them read-only instead of receiving a pickled copy.
+    data = np.array([[getattr(candle, name) for candle in candles] for name in COLUMNS], dtype=np.float64)
+    shm = SharedMemory(create=True, size=data.nbytes)
+    try:
+        np.ndarray(data.shape, dtype=np.float64, buffer=shm.buf)[:] = data
+
+        groups: typing.Dict[typing.Tuple, typing.List[typing.Dict]] = dict()
+        for combo in combos:
+            groups.setdefault(tuple(combo[name] for name in INDICATOR_PARAMS[strategy_type]), []).append(combo)
+        tasks = [(strategy_type, group, fee_pct) for _, group in sorted(groups.items())]
+
+        results = []
+        with ProcessPoolExecutor(max_workers=processes, initializer=_attach,
+                                 initargs=(shm.name, data.shape[1])) as executor:
+            for chunk in executor.map(_evaluate, tasks):
+                results.extend(chunk)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results.sort(key=lambda result: result['return_pct'], reverse=True)
+    return results
+
+
+def format_results(results: typing.List[typing.Dict], top: int = 20) -> str:
+    if not results:
+        return 'No results.'
+    headers = list(results[0])
+    rows = [[f"{value:.4g}" if isinstance(value, float) else str(value) for value in result.values()]
+            for result in results[:top]]
+    widths = [max(len(header), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    lines = ['  '.join(header.rjust(width) for header, width in zip(headers, widths))]
+    lines.extend('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+    return '\n'.join(lines)
+
+
+def scaling(candles: typing.List[Candle], strategy_type: str, combos: typing.List[typing.Dict],
+            core_counts: typing.Optional[typing.List[int]] = None) -> typing.List[typing.Tuple[int, float]]:
+    # Wall clock of the same sweep for each process count.
+    if core_counts is None:
+        core_counts = sorted({2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()} |
+                             {os.cpu_count()})
+    timings = []
+    for cores in core_counts:
+        start = time.perf_counter()
+        run_sweep(candles, strategy_type, combos, processes=cores)
+        timings.append((cores, time.perf_counter() - start))
+    return timings
+
+
+if __name__ == '__main__':
+    # python optimizer.py Technical BTCUSDT 1m [--db candles.db] [--samples N] [--processes N] [--scaling]
+    # With --synthetic N, a random walk of N candles is used instead of the backfill cache.
+    import argparse
+    from connectors.backfill import HistoricalBackfill, CANDLES_PATH
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('strategy', choices=list(DEFAULT_GRIDS))
+    parser.add_argument('symbol', nargs='?', default='BTCUSDT')
+    parser.add_argument('interval', nargs='?', default='1m')
+    parser.add_argument('--db', default=CANDLES_PATH, help='candles_testnet.db for testnet klines')
+    parser.add_argument('--samples', type=int)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--synthetic', type=int)
+    parser.add_argument('--scaling', action='store_true')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        closes = 20000 * np.exp(np.cumsum(rng.normal(0, 0.002, args.synthetic)))
+        opens = np.concatenate([[closes[0]], closes[:-1]])
+        wick = np.abs(rng.normal(0, 0.001, args.synthetic)) * closes
+        history = [Candle([60000 * i, o, max(o, c) + w, min(o, c) - w, c, v], args.interval, 'Binance')
+                   for i, (o, c, w, v) in enumerate(zip(opens, closes, wick, rng.uniform(1, 1000, args.synthetic)))]
+    else:
+        history = HistoricalBackfill(None, args.db).cached_candles(args.symbol, args.interval)
+    if not history:
+        raise SystemExit(f"No cached {args.symbol} {args.interval} candles in {args.db}.")
+
+    parameter_sets = parameter_combos(DEFAULT_GRIDS[args.strategy], args.samples)
+    print(f"{len(parameter_sets)} combos over {len(history)} candles.")
+    if args.scaling:
+        for cores, seconds in scaling(history, args.strategy, parameter_sets):
+            print(f"{cores:>3} processes: {seconds:7.2f} s")
+    else:
+        start_time = time.perf_counter()
+        ranked = run_sweep(history, args.strategy, parameter_sets, args.processes)
+        print(format_results(ranked))
+        print(f"{time.perf_counter() - start_time:.2f} s")
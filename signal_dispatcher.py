@@ -0,0 +1,132 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+
+class SignalDispatcher:
+    # Runs Strategy.check_trade (signal evaluation and order placement) on worker threads so the websocket
+    # thread only aggregates candles. A strategy always goes to the same worker, so its ticks are handled in
+    # order. A 'same_candle' tick is skipped if one is already waiting for that strategy, because
+    # check_signal reads the latest candle anyway. 'new_candle' ticks are always queued. A signal_result
+    # computed elsewhere (batch_signals.py) is handed to check_trade instead of calling check_signal. For those
+    # strategies a 'new_candle' tick without one only checks take profit and stop loss, so it coalesces too.
+    # received_ns goes along to check_trade for the tick-to-order span; a coalesced tick keeps the receive time
+    # of the one already waiting, so the span is measured from the earliest.
+    # The candle and indicator values check_trade needs (Strategy.signal_inputs) are taken in submit, on the
+    # websocket thread that writes them, and go in the queue item, so workers never read them as they change.
+    # A coalesced tick puts its newer values into the waiting item. Once a batched strategy's tick is queued,
+    # its batch is evaluated if every member has closed the candle, so signals are queued after that tick. Only a tick queued after the strategy's last
+    # 'new_candle' can take newer values, and a worker takes its item under the same lock, so a tick is never
+    # written into an item already taken or run ahead of an older candle close.
+    def __init__(self, workers: int = 4, queue_size: int = 1000):
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        # id(strategy) -> [inputs] of its waiting same_candle tick.
+        self._pending: typing.Dict[int, typing.List] = dict()
+        self._pending_lock = threading.Lock()
+        self._assignments: typing.Dict[int, int] = dict()
+        self._assigned = itertools.count()
+
+        self._submitted = [0] * workers
+        self._processed = [0] * workers
+        self._dropped = [0] * workers
+        self._coalesced = [0] * workers
+        self._last_lag_ms = [0.0] * workers
+        self._max_lag_ms = [0.0] * workers
+
+        for worker in range(workers):
+            t = threading.Thread(target=self._run, args=(worker,), name=f'signal-worker-{worker}')
+            t.daemon = True
+            t.start()
+
+    def _worker_for(self, strategy) -> int:
+        # Round-robin on first sight, then sticky.
+        worker = self._assignments.get(id(strategy))
+        if worker is None:
+            worker = self._assignments.setdefault(id(strategy), next(self._assigned) % len(self._queues))
+        return worker
+
+    def forget(self, strategy):
+        self._assignments.pop(id(strategy), None)
+        with self._pending_lock:
+            self._pending.pop(id(strategy), None)
+
+    def submit(self, strategy, tick_type: str, signal_result: typing.Optional[int] = None,
+               received_ns: int = 0, inputs: typing.Optional[typing.Tuple] = None) -> bool:
+        # inputs: strategy.signal_inputs, when the caller took them earlier on the websocket thread.
+        worker = self._worker_for(strategy)
+        if tick_type == 'new_candle' and signal_result is None and strategy.batch is not None:
+            tick_type = 'same_candle'
+        if inputs is None:
+            inputs = strategy.signal_inputs(tick_type)
+
+        box = [inputs]
+        coalesced = dropped = False
+        with self._pending_lock:
+            if tick_type == 'same_candle':
+                waiting = self._pending.get(id(strategy))
+                if waiting is not None:
+                    waiting[0] = inputs
+                    coalesced = True
+                else:
+                    self._pending[id(strategy)] = box
+            else:
+                # Later ticks queue behind this one instead of updating one queued before it.
+                self._pending.pop(id(strategy), None)
+            if not coalesced:
+                try:
+                    self._queues[worker].put_nowait((strategy, tick_type, signal_result, received_ns, box,
+                                                     time.perf_counter()))
+                except queue.Full:
+                    dropped = True
+                    if self._pending.get(id(strategy)) is box:
+                        del self._pending[id(strategy)]
+        if strategy.batch is not None:
+            strategy.batch.flush_due()
+
+        if coalesced:
+            self._coalesced[worker] += 1
+        elif dropped:
+            self._dropped[worker] += 1
+            logger.warning("Signal queue %d is full, dropped %s tick for %s.", worker, tick_type,
+                           strategy.contract.symbol)
+            return False
+        else:
+            self._submitted[worker] += 1
+        return True
+
+    def _run(self, worker: int):
+        q = self._queues[worker]
+        while True:
+            strategy, tick_type, signal_result, received_ns, box, submitted = q.get()
+            with self._pending_lock:
+                if self._pending.get(id(strategy)) is box:
+                    del self._pending[id(strategy)]
+                inputs = box[0]
+
+            lag_ms = (time.perf_counter() - submitted) * 1000
+            self._last_lag_ms[worker] = lag_ms
+            if lag_ms > self._max_lag_ms[worker]:
+                self._max_lag_ms[worker] = lag_ms
+
+            try:
+                strategy.check_trade(tick_type, signal_result, received_ns, inputs)
+            except Exception as e:
+                logger.error("Error while checking %s signal for %s: %s", tick_type, strategy.contract.symbol, e)
+
+            self._processed[worker] += 1
+
+    def metrics(self) -> typing.Dict[str, typing.List]:
+        return {
+            'queue_depth': [q.qsize() for q in self._queues],
+            'submitted': list(self._submitted),
+            'processed': list(self._processed),
+            'coalesced': list(self._coalesced),
+            'dropped': list(self._dropped),
+            'last_lag_ms': list(self._last_lag_ms),
+            'max_lag_ms': list(self._max_lag_ms),
+        }
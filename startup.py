@@ -0,0 +1,56 @@
+import time
+_START = time.perf_counter()
+
+import json
+import logging
+import threading
+import typing
+
+logger = logging.getLogger()
+
+# Import first in an entry point. Milliseconds from that import to each startup milestone are logged and
+# appended to STARTUP_LOG as one JSON line per launch, once the process is ready and the first market tick has
+# arrived, or FIRST_TICK_TIMEOUT seconds after it is ready, whichever is first.
+# No stream is subscribed until a strategy or a watchlist row needs one, which in the UI waits for the user.
+# So first_tick is also given as first_tick_after_subscription, from the first stream subscription, which is
+# what compares between launches. A UI left idle past the timeout records its profile without either.
+STARTUP_LOG = 'startup_profile.jsonl'
+FIRST_TICK_TIMEOUT = 60.0
+
+_marks: typing.Dict[str, float] = dict()
+_lock = threading.Lock()
+_recorded = False
+
+
+def mark(name: str):
+    # Only the first mark of each name counts, so this is safe to call from every tick.
+    if name in _marks:
+        return
+    with _lock:
+        if name not in _marks:
+            _marks[name] = round((time.perf_counter() - _START) * 1000, 1)
+    if name == 'ready':
+        logger.info('Startup: %s', ', '.join(f"{key} {value:.0f} ms" for key, value in _marks.items()))
+        timer = threading.Timer(FIRST_TICK_TIMEOUT, record)
+        timer.daemon = True
+        timer.start()
+    if name in ('ready', 'first_tick') and 'ready' in _marks and 'first_tick' in _marks:
+        record()
+
+
+def record():
+    global _recorded
+    with _lock:
+        if _recorded:
+            return
+        _recorded = True
+        profile = {'time': int(time.time()), **_marks}
+        if 'first_tick' in _marks and 'first_subscription' in _marks:
+            profile['first_tick_after_subscription'] = round(_marks['first_tick'] - _marks['first_subscription'], 1)
+
+    logger.info('Startup profile: %s', profile)
+    try:
+        with open(STARTUP_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(profile) + '\n')
+    except OSError as e:
+        logger.error('Could not write the startup profile: %s', e)
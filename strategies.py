@@ -1,11 +1,21 @@
 import logging
+import threading
 import time
 from typing import *
-import pandas as pd
+import numpy as np
 
+import instrumentation
 from models import *
+from indicators import Macd, Rsi
+from candle_series import CandleSeries
 logger = logging.getLogger()
 
+# Candles kept per strategy. Indicators are incremental, so this only bounds what check_signal can look back on.
+CANDLE_RETENTION = 5000
+
+# Gaps of this many candles or more are reloaded from the exchange rather than left as flat filler candles.
+RESYNC_GAP = 30
+
 TF_EQUIV = {"1m": 60, "5m": 300, "15m": 900, "30m": 900, "1h": 3600, "4h": 14400}
 
 # Convert '1m' into 60000, '2h' into 7200000.
@@ -18,16 +28,28 @@ def timeframe_equiv(tf: str) -> int:
         'd': 24*60*60*1000,
         'w': 7*24*60*60*1000
     }
-    logger.debug("Timeframe equiv: %s", tf)
     per = tf[-1:]
     base = bases[per]
     mult = int(tf[:-1])
     return base * mult
 
 
+# Entry rules, shared by the strategies, batch_signals and the optimizer. They take numbers or numpy arrays and
+# return the (long, short) conditions. NaN compares false, so it never signals.
+
+def technical_rule(rsi, macd_line, macd_signal):
+    return (rsi < 30) & (macd_line > macd_signal), (rsi > 70) & (macd_line < macd_signal)
+
+
+def breakout_rule(volume, price, previous_high, previous_low, min_volume):
+    # Price beyond the previous candle's range, with the live candle's volume over the minimum.
+    active = volume > min_volume
+    return active & (price > previous_high), active & (price < previous_low)
+
+
 class Strategy:
     def __init__(self, client, contract: Contract, exchange: str, timeframe: str, balance_pct: float, take_profit: float,
-                 stop_loss: float):
+                 stop_loss: float, candle_retention: int = CANDLE_RETENTION):
         self.client = client
         self.contract = contract
         self.exchange = exchange
@@ -38,152 +60,345 @@ class Strategy:
         self.stop_loss = stop_loss
 
         self.open_position = False
+        self.trades: List[Trade] = []
+        # Orders are only placed, and positions only tracked and closed at take profit or stop loss, when this is
+        # set: by the backtester, and live by the client when PLACE_ORDERS = True in binance_keys.py. Otherwise a
+        # signal only computes the trade size.
+        self.place_orders = False
+        # Backtests replay old trades, so the live lag warning in parse_trades is switched off there.
+        self.latency_check = True
+        # Set to 0 to always fill gaps with flat candles, as backtests do.
+        self.resync_gap = RESYNC_GAP
+        self._resyncing = False
+        self._resynced_candles: Optional[List[Candle]] = None
+        self._candles_generation = -1
+        # Set by batch_signals.SignalBatcher when signals are evaluated together with other strategies of the same
+        # parameters. check_trade then gets them as signal_result rather than calling check_signal.
+        self.batch = None
+        # journal.Journal set by the client, so positions are recorded and survive a restart. None in backtests.
+        self.journal = None
+        # Key for this strategy's latency spans.
+        self.label = f"{type(self).__name__} {contract.symbol} {timeframe}"
+
+        self.candles = CandleSeries(candle_retention)
+
+    def load_candles(self, candles: List[Candle]):
+        self.candles.clear()
+        self.candles.extend(candles)
+        self._on_candles_loaded()
+
+    def _on_candles_loaded(self):
+        # The whole series was replaced: anything derived from earlier candles must be rebuilt.
+        self._candles_generation = self.candles.generation
+        self._on_new_candle()
+
+    def _on_new_candle(self, received_ns: int = 0):
+        return
+
+    def signal_inputs(self, tick_type: str) -> Tuple:
+        # The candle and indicator values check_trade reads, taken on the websocket thread, which is the one
+        # writing them, and handed to the signal worker with the tick. (live candle open time, close, volume)
+        # here; subclasses add what their check_signal needs.
+        return self.candles.live()
+
+    # received_ns, here and down to _open_position, is when the trade's message arrived (perf_counter_ns) with
+    # latency spans on, and 0 otherwise. It travels with the tick, so concurrent ticks each time their own span.
+
+    def parse_trades(self, price: float, size: float, timestamp: int, received_ns: int = 0):
+        # A finished resync is swapped in here, on the websocket thread, which is the only one writing candles.
+        # History that stops short of the previous candle is dropped, or the same gap would be found again.
+        if self._resynced_candles is not None:
+            candles, self._resynced_candles = self._resynced_candles, None
+            if len(self.candles) == 0 or candles[-1].timestamp >= self.candles.last_timestamp - self.timeframe_ms:
+                self.load_candles(candles)
+            else:
+                logger.warning("Resync of %s %s returned stale candles.", self.contract.symbol, self.timeframe)
+        elif self.candles.generation != self._candles_generation:
+            # Took over a shared series that was reloaded while this strategy was following it.
+            self._on_candles_loaded()
+
+        if self.latency_check:
+            time_diff = int(time.time() * 1000) - timestamp
+            if time_diff >= 2000:
+                logger.warning("%s %s: %s time difference between current and trade time.", self.exchange,
+                               self.contract.symbol, time_diff)
+                logger.warning("check_signal may be running long.")
+
+        tick_type, missing_candles = self.candles.add_trade(price, size, timestamp, self.timeframe_ms)
+        if tick_type == 'new_candle':
+            if missing_candles:
+                logger.info("%s is missing %d candles for %s %s.", self.exchange, missing_candles,
+                            self.contract.symbol, self.timeframe)
+                if self.resync_gap and missing_candles >= self.resync_gap:
+                    self._start_resync()
+            else:
+                logger.info("New candle for %s on %s.", self.contract.symbol, self.exchange)
+            self._on_new_candle(received_ns)
+        return tick_type
+
+    def follow_tick(self, tick_type: str, received_ns: int = 0) -> str:
+        # parse_trades for a strategy sharing another strategy's candles (see aggregator.py): the trade is
+        # already in the series, only this strategy's own state needs to catch up.
+        if self.candles.generation != self._candles_generation:
+            self._on_candles_loaded()
+        elif tick_type == 'new_candle':
+            self._on_new_candle(received_ns)
+        return tick_type
+
+    def _start_resync(self):
+        # The flat candles stand in until the real ones arrive. Fetching runs off the websocket thread, which
+        # must keep reading, and the async client's event loop could not wait on its own request anyway.
+        if self._resyncing:
+            return
+        self._resyncing = True
+        t = threading.Thread(target=self._resync, daemon=True)
+        t.start()
+
+    def _resync(self):
+        try:
+            candles = self.client.backfill.get_candles(self.contract, self.timeframe)
+        except Exception as e:
+            logger.error("Could not resync %s %s candles: %s", self.contract.symbol, self.timeframe, e)
+            candles = []
+        if candles:
+            logger.info("Resynced %d candles for %s %s.", len(candles), self.contract.symbol, self.timeframe)
+            self._resynced_candles = candles
+        self._resyncing = False
+
+    def _open_position(self, signal_result: int, inputs: Tuple, received_ns: int = 0):
+        candle_time, price = inputs[0], inputs[1]
+        if self.journal is not None:
+            self.journal.signal(self, signal_result, price)
+        if instrumentation.enabled:
+            start = time.perf_counter_ns()
+        trade_size = self.client.get_trade_size(self.contract, price, self.balance_pct)
+        if instrumentation.enabled:
+            instrumentation.record('get_trade_size', self.label, start)
+        if trade_size is None or not self.place_orders:
+            return
 
-        self.candles: List[Candle] = []
-
-    def parse_trades(self, price: float, size: float, timestamp: int):
-
-        time_diff = int(time.time() * 1000) - timestamp
-        if time_diff >= 2000:
-            logger.warning("%s %s: %s time difference between current and trade time.", self.exchange,
-                           self.contract.symbol, time_diff)
-            logger.warning("check_signal may be running long.")
-        last_candle = self.candles[-1]
-        # Same candle
-        if timestamp < last_candle.timestamp + self.timeframe_ms:
-            last_candle.close = price
-            last_candle.volume += size
-
-            if price > last_candle.high:
-                last_candle.high = price
-            elif price < last_candle.low:
-                last_candle.low = price
-            return 'Same candle'
-
-        # Missing candles
-        elif timestamp >= last_candle.timestamp + (2 * self.timeframe_ms):
-            missing_candles = int((timestamp - last_candle.timestamp) / self.timeframe_ms) - 1
-
-            logger.info("%s is missing %d candles for %s %s.", self.exchange, missing_candles, self.contract.symbol,
-                        self.timeframe)
-            new_timestamp = last_candle.timestamp + self.timeframe_ms
-            candle_info = {'ts': new_timestamp, 'open': price, 'close': price, 'low': price, 'high': price,
-                           'volume': size}
-            new_candle = Candle(candle_info, self.timeframe, 'parse_trade')
-            self.candles.append(new_candle)
-            for missing in range(missing_candles):
-                new_timestamp = last_candle.timestamp + self.timeframe_ms
-                candle_info = {'ts': new_timestamp, 'open': last_candle.close, 'close': last_candle.close,
-                               'low': last_candle.close, 'high': last_candle.close, 'volume': 0}
-                new_candle = Candle(candle_info, self.timeframe, 'parse_trade')
-                self.candles.append(new_candle)
-                last_candle = new_candle
-            new_timestamp = last_candle.timestamp + self.timeframe_ms
-            candle_info = {'ts': new_timestamp, 'open': price, 'close': price, 'low': price, 'high': price,
-                           'volume': size}
-            new_candle = Candle(candle_info, self.timeframe, 'parse_trade')
-            self.candles.append(new_candle)
-            return 'New candle. Missing some.'
-        # New candle
-        elif timestamp >= last_candle.timestamp + self.timeframe_ms:
-            new_timestamp = last_candle.timestamp + self.timeframe_ms
-            candle_info = {'ts': new_timestamp, 'open': price, 'close': price, 'low': price, 'high': price,
-                           'volume': size}
-            new_candle = Candle(candle_info, self.timeframe, 'parse_trade')
-            self.candles.append(new_candle)
-            logger.info(f"New candle for {self.contract.symbol} on {self.exchange}.")
-            return 'New candle.'
-
-    def _open_position(self, signal_result: int):
-        trade_size = self.client.get_trade_size(self.contract, self.candles[-1].close, self.balance_pct)
-        if trade_size is None:
+        order_side = 'BUY' if signal_result == 1 else 'SELL'
+        order_status = self.client.place_order(self.contract, order_side, trade_size, 'MARKET')
+        if order_status is None:
             return
+        if instrumentation.enabled and received_ns:
+            instrumentation.record('tick_to_order', self.label, received_ns)
+
+        logger.info("%s %s order placed on %s for %s %s.", type(self).__name__, order_side, self.exchange,
+                    trade_size, self.contract.symbol)
+        # Market orders are often acknowledged before they fill, with a zero average price.
+        entry_price = order_status.avg_price if order_status.avg_price > 0 else price
+        self.open_position = True
+        self.trades.append(Trade({'time': candle_time, 'contract': self.contract,
+                                  'strategy': type(self).__name__, 'side': 'long' if signal_result == 1 else 'short',
+                                  'entry_price': entry_price, 'status': 'open', 'pnl': 0.0, 'quantity': trade_size,
+                                  'entry_id': order_status.order_id}))
+        if self.journal is not None:
+            self.journal.position_opened(self, self.trades[-1])
+
+    def _check_tp_sl(self, inputs: Tuple):
+        if not self.place_orders or not self.open_position or len(self.trades) == 0:
+            return
+        trade = self.trades[-1]
+        price = inputs[1]
+
+        if trade.side == 'long':
+            pnl_pct = (price - trade.entry_price) / trade.entry_price * 100
+        else:
+            pnl_pct = (trade.entry_price - price) / trade.entry_price * 100
+
+        if pnl_pct >= self.take_profit or pnl_pct <= -self.stop_loss:
+            order_side = 'SELL' if trade.side == 'long' else 'BUY'
+            # Reduce-only, so an exit can't open a position the other way if this one was closed outside the bot.
+            # The exchange nets the positions of every strategy on the symbol, though: when others hold more the
+            # other way, a reduce-only exit would be rejected, so then it goes without.
+            reduce_only = self.journal is None or (self.journal.net_position(self.contract.symbol) *
+                                                   (1 if trade.side == 'long' else -1) >= trade.quantity * (1 - 1e-6))
+            order_status = self.client.place_order(self.contract, order_side, trade.quantity, 'MARKET',
+                                                   reduce_only=reduce_only)
+            if order_status is None:
+                if reduce_only:
+                    self._check_position_gone(trade)
+                return
+
+            exit_price = order_status.avg_price if order_status.avg_price > 0 else price
+            if trade.side == 'long':
+                trade.pnl = (exit_price - trade.entry_price) * trade.quantity
+            else:
+                trade.pnl = (trade.entry_price - exit_price) * trade.quantity
+            trade.status = 'closed'
+            self.open_position = False
+            if self.journal is not None:
+                self.journal.position_closed(self, trade, exit_price)
+            logger.info("%s closed %s %s position: pnl %.4f.", type(self).__name__, trade.side,
+                        self.contract.symbol, trade.pnl)
+
+
+    def _check_position_gone(self, trade: Trade):
+        # A reduce-only exit is rejected when the exchange no longer holds the position: it was closed by hand or
+        # liquidated. The position is then recorded as closed, with its pnl unknown, instead of the exit being
+        # retried on every tick.
+        if self.journal is None:
+            return
+        positions = self.client.get_positions()
+        if positions is None:
+            return
+        held = positions.get(self.contract.symbol, 0.0) * (1 if trade.side == 'long' else -1)
+        if held >= trade.quantity * (1 - 1e-6):
+            return
+        logger.warning("%s %s %s position is not on the exchange (position %s); recording it as closed.",
+                       type(self).__name__, trade.side, self.contract.symbol, positions.get(self.contract.symbol, 0.0))
+        trade.status = 'closed'
+        self.open_position = False
+        self.journal.position_closed(self, trade, 0.0)
 
 
 class TechnicalStrategy(Strategy):
     def __init__(self, client, contract: Contract, exchange: str, timeframe: str, balance_pct: float, take_profit: float,
-                 stop_loss: float, other_params: Dict):
-        super().__init__(client, contract, exchange, timeframe, balance_pct, take_profit, stop_loss)
+                 stop_loss: float, other_params: Dict, candle_retention: int = CANDLE_RETENTION):
+        super().__init__(client, contract, exchange, timeframe, balance_pct, take_profit, stop_loss, candle_retention)
         self._ema_fast = other_params['ema_fast']
         self._ema_slow = other_params['ema_slow']
         self._ema_signal = other_params['ema_signal']
         self._rsi_length = other_params['rsi_length']
-        logger.debug(f"Started Technical strategy on {contract}.")
-
-    def _rsi(self):
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
 
-        closes = pd.Series(close_list)
-        delta = closes.diff().dropna()
-
-        up, down = delta.copy(), delta.copy()
-        up[up < 0] = 0
-        down[down > 0] = 0
-
-        avg_gain = up.ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-        avg_loss = down.abs().ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-        rs = avg_gain / avg_loss
-
-        rsi = 100 - (100/(1+rs))
-        rsi = rsi.round(2)
+        self._macd_state = Macd(self._ema_fast, self._ema_slow, self._ema_signal)
+        self._rsi_state = Rsi(self._rsi_length)
+        self._last_indicator_ts = -1
+        # While in a batch, the scalar states above are only used to seed it.
+        self.batch_row = -1
+        logger.debug(f"Started Technical strategy on {contract}.")
 
-        return rsi.iloc[-2]
+    @property
+    def indicator_params(self) -> Tuple[int, int, int, int]:
+        return self._ema_fast, self._ema_slow, self._ema_signal, self._rsi_length
+
+    def _on_candles_loaded(self):
+        # Reloads (after a resync) replace candles the indicators have already seen, so they start over.
+        self._candles_generation = self.candles.generation
+        self._macd_state = Macd(self._ema_fast, self._ema_slow, self._ema_signal)
+        self._rsi_state = Rsi(self._rsi_length)
+        self._last_indicator_ts = -1
+        for close in self._new_closes():
+            self._macd_state.update(close)
+            self._rsi_state.update(close)
+        if self.batch is not None:
+            self.batch.adopt(self)
+
+    def _on_new_candle(self, received_ns: int = 0):
+        closes = self._new_closes()
+        if self.batch is not None:
+            if closes:
+                self.batch.candle_closed(self, closes, received_ns)
+            return
+        for close in closes:
+            self._macd_state.update(close)
+            self._rsi_state.update(close)
+
+    def _new_closes(self) -> List[float]:
+        # Every closed candle (all but the live one) that the indicators have not seen yet.
+        timestamps = self.candles.timestamp[:-1]
+        if len(timestamps) == 0:
+            return []
+        last_closed = int(timestamps[-1])
+        if last_closed == self._last_indicator_ts + self.timeframe_ms:
+            # Usual case: exactly one candle closed since the last call.
+            self._last_indicator_ts = last_closed
+            return [float(self.candles.close[-2])]
+        start = int(timestamps.searchsorted(self._last_indicator_ts, side='right'))
+        self._last_indicator_ts = last_closed
+        return self.candles.close[start:-1].tolist()
+
+    def _rsi(self) -> float:
+        if self.batch is not None:
+            return self.batch.rsi(self)
+        return self._rsi_state.value
 
     def _macd(self) -> Tuple[float, float]:
-
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
-
-        closes = pd.Series(close_list)
-
-        ema_fast = closes.ewm(span=self._ema_fast).mean()
-        ema_slow = closes.ewm(span=self._ema_slow).mean()
-        macd_line = ema_fast - ema_slow
-        macd_signal = macd_line.ewm(span=self._ema_signal).mean()
-
-        return macd_line.iloc[-2], macd_signal.iloc[-2]
-
-    def check_trade(self, tick_type: str):
-        if tick_type == "new_candle":
-            signal_result = self.check_signal()
+        if self.batch is not None:
+            return self.batch.macd(self)
+        return self._macd_state.macd_line, self._macd_state.macd_signal
+
+    def signal_inputs(self, tick_type: str) -> Tuple:
+        # Adds (macd line, macd signal, rsi) when check_trade will call check_signal.
+        if tick_type != 'new_candle' or self.batch is not None:
+            return self.candles.live()
+        macd_line, macd_signal = self._macd()
+        return self.candles.live() + (macd_line, macd_signal, self._rsi())
+
+    def check_trade(self, tick_type: str, signal_result: Optional[int] = None, received_ns: int = 0,
+                    inputs: Optional[Tuple] = None):
+        # inputs is signal_inputs(tick_type), taken when the tick was handed over, or now if it wasn't.
+        if inputs is None:
+            inputs = self.signal_inputs(tick_type)
+        if signal_result is None:
+            # A batch's signal is queued after the tick it was computed on, which checked these already.
+            self._check_tp_sl(inputs)
+
+        if tick_type == "new_candle" and not self.open_position:
+            if signal_result is None:
+                if self.batch is not None:
+                    # The batch submits this candle again with its signal once the whole burst is evaluated.
+                    return
+                if instrumentation.enabled:
+                    start = time.perf_counter_ns()
+                signal_result = self.check_signal(inputs)
+                if instrumentation.enabled:
+                    instrumentation.record('check_signal', self.label, start)
 
             if signal_result in [1, -1]:
-                self._open_position(signal_result)
+                self._open_position(signal_result, inputs, received_ns)
 
-    def check_signal(self):
-        macd_line, macd_signal = self._macd()
-        rsi = self._rsi()
-
-        if rsi < 30 and macd_line > macd_signal:
-            return 1
-        elif rsi > 70 and macd_line < macd_signal:
-            return -1
-        else:
-            return 0
+    def check_signal(self, inputs: Optional[Tuple] = None):
+        if inputs is None:
+            inputs = self.signal_inputs('new_candle')
+        macd_line, macd_signal, rsi = inputs[3:6]
+        long, short = technical_rule(rsi, macd_line, macd_signal)
+        return 1 if long else -1 if short else 0
 
 
 class BreakoutStrategy(Strategy):
     def __init__(self, client, contract: Contract, exchange: str, timeframe: str, balance_pct: float, take_profit: float,
-                 stop_loss: float, other_params: Dict):
-        super().__init__(client, contract, exchange, timeframe, balance_pct, take_profit, stop_loss)
+                 stop_loss: float, other_params: Dict, candle_retention: int = CANDLE_RETENTION):
+        super().__init__(client, contract, exchange, timeframe, balance_pct, take_profit, stop_loss, candle_retention)
         self._min_volume = other_params['min_volume']
         logger.debug(f"Started Breakout strategy on {contract}.")
 
-    def check_signal(self) -> int:
-        if self.candles[-1].volume > self._min_volume:
-            if self.candles[-1].close > self.candles[-2].high:
-                return 1
-            if self.candles[-1].close < self.candles[-2].low:
-                return -1
-        return 0
+    def signal_inputs(self, tick_type: str) -> Tuple:
+        # Adds (previous high, previous low); NaN, which never signals, before there are two candles.
+        return self.candles.live() + self.candles.previous_range()
 
-    def check_trade(self, tick_type: str):
+    def check_signal(self, inputs: Optional[Tuple] = None) -> int:
+        if inputs is None:
+            inputs = self.signal_inputs('same_candle')
+        _, close, volume, previous_high, previous_low = inputs
+        long, short = breakout_rule(volume, close, previous_high, previous_low, self._min_volume)
+        return 1 if long else -1 if short else 0
+
+    def check_trade(self, tick_type: str, signal_result: Optional[int] = None, received_ns: int = 0,
+                    inputs: Optional[Tuple] = None):
+        if inputs is None:
+            inputs = self.signal_inputs(tick_type)
+        self._check_tp_sl(inputs)
 
         if not self.open_position:
-            signal_result = self.check_signal()
+            if signal_result is None:
+                if instrumentation.enabled:
+                    start = time.perf_counter_ns()
+                signal_result = self.check_signal(inputs)
+                if instrumentation.enabled:
+                    instrumentation.record('check_signal', self.label, start)
 
             if signal_result in [1, -1]:
-                self._open_position(signal_result)
+                self._open_position(signal_result, inputs, received_ns)
+
+
+# Strategy types by the name used in the editor and in daemon config files.
+STRATEGY_CLASSES = {'Technical': TechnicalStrategy, 'Breakout': BreakoutStrategy}
+
+# Extra parameters each strategy type needs: (code name, label, type).
+STRATEGY_PARAMS = {
+    'Technical': [('ema_fast', 'MACD fast period', int), ('ema_slow', 'MACD slow period', int),
+                  ('ema_signal', 'MACD signal period', int), ('rsi_length', 'RSI period', int)],
+    'Breakout': [('min_volume', 'Minimum volume', float)],
+}